@@ -1,33 +1,44 @@
 import os
+import sys
+import csv
+import json
+import argparse
 from mutagen.flac import FLAC
 from mutagen.mp3 import EasyMP3
 
-def check_audio_files(folder):
+from lineup_catalog import AudioCatalog, SCAN_WORKERS
+
+def check_audio_files(folder, recursive=False, workers=1, on_found=None, catalog=None):
+    """返回 (标题为 kuwo 的文件, 不含歌词的文件)。
+
+    标签来自共享的标签目录 catalog（lineup_catalog.AudioCatalog），扫描时只解析新增或
+    修改过的文件；不提供时使用只在内存中的目录，所有文件都重新解析。
+    on_found(类别, 相对路径) 在发现每个文件时立即调用，类别是 'kuwo_title' 或 'no_lyrics'。
+    """
     title_is_kuwo = []
     no_lyrics = []
-    for fname in os.listdir(folder):
-        if fname.lower().endswith('.flac'):
-            try:
-                audio = FLAC(os.path.join(folder, fname))
-                title = audio.get('title', [''])[0]
-                lyrics = audio.get('LYRICS', ['']) or audio.get('lyrics', [''])
-                if title == 'kuwo':
-                    title_is_kuwo.append(fname)
-                if not lyrics or lyrics[0].strip() == '':
-                    no_lyrics.append(fname)
-            except Exception:
-                continue
-        elif fname.lower().endswith('.mp3'):
-            try:
-                audio = EasyMP3(os.path.join(folder, fname))
-                title = audio.get('title', [''])[0]
-                lyrics = audio.get('lyrics', [''])
-                if title == 'kuwo':
-                    title_is_kuwo.append(fname)
-                if not lyrics or lyrics[0].strip() == '':
-                    no_lyrics.append(fname)
-            except Exception:
-                continue
+
+    def check(entry):
+        if not entry.ok:
+            return
+        if entry.title == 'kuwo':
+            title_is_kuwo.append(entry.path)
+            if on_found is not None:
+                on_found('kuwo_title', entry.path)
+        if not entry.has_lyrics:
+            no_lyrics.append(entry.path)
+            if on_found is not None:
+                on_found('no_lyrics', entry.path)
+
+    if catalog is None:
+        with AudioCatalog(folder, ":memory:") as memory:
+            memory.scan(recursive, workers, on_entry=check)
+    else:
+        catalog.scan(recursive, workers, on_entry=check)
+    if workers > 1:
+        # 并行读取时完成的顺序不固定
+        title_is_kuwo.sort()
+        no_lyrics.sort()
     return title_is_kuwo, no_lyrics
 
 def print_results(title_is_kuwo, no_lyrics):
@@ -42,10 +53,28 @@ def print_results(title_is_kuwo, no_lyrics):
     for f in no_lyrics:
         print(f)
 
-def reset_kuwo_titles(folder, kuwo_files):
+def write_json(out, folder, title_is_kuwo, no_lyrics):
+    json.dump({
+        "folder": os.path.abspath(folder),
+        "kuwo_title": title_is_kuwo,
+        "no_lyrics": no_lyrics,
+    }, out, ensure_ascii=False, indent=2)
+    out.write("\n")
+
+def csv_writer(out):
+    """返回 on_found 回调，每发现一个文件就写出一行 类别,路径。"""
+    writer = csv.writer(out)
+    writer.writerow(["category", "path"])
+
+    def on_found(category, fname):
+        writer.writerow([category, fname])
+        out.flush()
+    return on_found
+
+def reset_kuwo_titles(folder, kuwo_files, catalog=None):
     for fname in kuwo_files:
         filepath = os.path.join(folder, fname)
-        new_title = os.path.splitext(fname)[0]
+        new_title = os.path.splitext(os.path.basename(fname))[0]
         if fname.lower().endswith('.flac'):
             audio = FLAC(filepath)
             audio['title'] = new_title
@@ -54,15 +83,63 @@ def reset_kuwo_titles(folder, kuwo_files):
             audio = EasyMP3(filepath)
             audio['title'] = new_title
             audio.save()
+        if catalog is not None:
+            catalog.refresh(fname)
         print(f"已重设 {fname} 的标题为 {new_title}")
+    if catalog is not None:
+        catalog.commit()
 
-if __name__ == "__main__":
-    folder = os.getcwd()
-    title_is_kuwo, no_lyrics = check_audio_files(folder)
-    print_results(title_is_kuwo, no_lyrics)
-    if title_is_kuwo:
-        confirm = input(f"发现 {len(title_is_kuwo)} 个标题为kuwo的文件，是否重设标题为文件名？(y/n): ")
-        if confirm.lower() == 'y':
-            reset_kuwo_titles(folder, title_is_kuwo)
+def build_parser():
+    parser = argparse.ArgumentParser(description="检查 mp3/flac 文件中标题为 kuwo 和不含歌词的文件")
+    parser.add_argument("folder", nargs="?", default=os.getcwd(), help="要检查的文件夹（默认当前目录）")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归检查子文件夹")
+    parser.add_argument("-j", "--workers", type=int, default=SCAN_WORKERS, help="同时读取标签的文件数")
+    parser.add_argument("-f", "--format", choices=["text", "json", "csv"], default="text",
+                        help="输出格式；json/csv 只输出结果，不询问是否重设标题")
+    parser.add_argument("-o", "--output", help="把 json/csv 结果写入文件（默认标准输出）")
+    parser.add_argument("--cache", help="标签目录文件（默认是与 lineup 共用的 .<文件夹名>.lineup-catalog.sqlite）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用标签目录，重新解析所有文件")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    folder = args.folder
+    catalog = None if args.no_cache else AudioCatalog(folder, args.cache)
+    try:
+        return run(args, folder, catalog)
+    finally:
+        if catalog is not None:
+            catalog.close()
+
+def run(args, folder, catalog):
+    if args.format == "text":
+        # 边扫描边显示发现的文件
+        def on_found(category, fname):
+            if category == 'kuwo_title':
+                print(f"[kuwo] {fname}", flush=True)
+        title_is_kuwo, no_lyrics = check_audio_files(folder, args.recursive, args.workers, on_found, catalog)
+        print_results(title_is_kuwo, no_lyrics)
+        if catalog is not None:
+            print(f"\n解析了 {catalog.parsed} 个文件，{catalog.cached} 个文件没有变化，使用了标签目录中的记录")
+        if title_is_kuwo:
+            confirm = input(f"发现 {len(title_is_kuwo)} 个标题为kuwo的文件，是否重设标题为文件名？(y/n): ")
+            if confirm.lower() == 'y':
+                reset_kuwo_titles(folder, title_is_kuwo, catalog)
+            else:
+                print("取消重设。")
+        return 0
+
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            check_audio_files(folder, args.recursive, args.workers, csv_writer(out), catalog)
         else:
-            print("取消重设。")
\ No newline at end of file
+            title_is_kuwo, no_lyrics = check_audio_files(folder, args.recursive, args.workers, catalog=catalog)
+            write_json(out, folder, title_is_kuwo, no_lyrics)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
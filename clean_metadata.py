@@ -1,104 +1,274 @@
 import os
-import sys
+import time
+import argparse
+from fnmatch import fnmatch
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from mutagen.flac import FLAC
 from mutagen.mp3 import MP3
 from mutagen.id3._frames import TIT2, TPE1
 
+from lineup_catalog import AudioCatalog, has_id3v1, parse_filename
+
+LRC = 'lrc'
+TAGS = 'tags'
+
+# Labels for the per-action results counted by run_pipeline
+RESULT_LABELS = {
+    'lrc_deleted': ".lrc files deleted",
+    'lrc_would_delete': ".lrc files to delete",
+    'updated': "music files updated",
+    'would_update': "music files to update",
+    'clean': "music files already clean",
+    'error': "errors",
+}
+
 def delete_lrc_files(folder):
     """Delete all .lrc files in the folder and subfolders."""
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            if file.lower().endswith('.lrc'):
-                filepath = os.path.join(root, file)
-                try:
-                    os.remove(filepath)
-                    print(f"Deleted: {filepath}")
-                except Exception as e:
-                    print(f"Error deleting {filepath}: {e}")
-
-def parse_filename(filename):
-    """Parse filename to extract artist and title.
-    If '&' exists, split on the first '-' after the last '&'.
-    If no '&', split on the first '-'.
-    """
-    name = os.path.splitext(filename)[0]
-    if '&' in name:
-        # Find last '&'
-        last_amp = name.rfind('&')
-        # Part after last '&'
-        after_amp = name[last_amp + 1:]
-        if '-' in after_amp:
-            # Find first '-' in after_amp
-            first_dash = after_amp.find('-')
-            # Artist: everything before last_amp + '&' + after_amp[:first_dash]
-            artist = name[:last_amp + 1] + after_amp[:first_dash]
-            title = after_amp[first_dash + 1:]
-        else:
-            # No '-' after last '&', treat as invalid
-            artist = ''
-            title = name
+    return run_pipeline(folder, actions=(LRC,), on_result=print_result)
+
+def delete_lrc(filepath, dry_run=False):
+    """Delete one .lrc file and return (result, message)."""
+    if dry_run:
+        return 'lrc_would_delete', f"Would delete: {filepath}"
+    try:
+        os.remove(filepath)
+        return 'lrc_deleted', f"Deleted: {filepath}"
+    except Exception as e:
+        return 'error', f"Error deleting {filepath}: {e}"
+
+def keep_padding(info):
+    """Reuse the existing padding so the tags are rewritten in place when they fit."""
+    return info.padding if info.padding >= 0 else info.get_default_padding()
+
+def load_audio(filepath):
+    """Open a flac or mp3 file, or return None for other files."""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.flac':
+        return FLAC(filepath)
+    if ext == '.mp3':
+        return MP3(filepath)
+    return None
+
+def is_clean(audio, artist, title):
+    """True if the tags are exactly what clean_metadata would write."""
+    if audio.tags is None:
+        return False
+    if isinstance(audio, FLAC):
+        expected = {'title': [title]}
+        if artist:
+            expected['artist'] = [artist]
+        keys = {key.lower() for key in audio.tags.keys()}
+        return keys == set(expected) and all(audio.tags.get(key) == value for key, value in expected.items())
+    # mutagen merges an ID3v1 tag into audio.tags, but rewrite_tags would remove it
+    if has_id3v1(audio.filename):
+        return False
+    expected = {'TIT2': [title]}
+    if artist:
+        expected['TPE1'] = [artist]
+    return (set(audio.tags.keys()) == set(expected)
+            and all(list(audio.tags[key].text) == value for key, value in expected.items()))
+
+def rewrite_tags(audio, artist, title):
+    """Replace all tags with title and artist, keeping the padding so the file is not rewritten."""
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags.clear()
+    if isinstance(audio, FLAC):
+        audio['title'] = title
+        if artist:
+            audio['artist'] = artist
+        audio.save(padding=keep_padding)
     else:
-        # No '&', split on first '-'
-        if '-' in name:
-            first_dash = name.find('-')
-            artist = name[:first_dash]
-            title = name[first_dash + 1:]
-        else:
-            artist = ''
-            title = name
-    return artist.strip(), title.strip()
+        audio['TIT2'] = TIT2(encoding=3, text=title)  # Title with UTF-8 encoding
+        if artist:
+            audio['TPE1'] = TPE1(encoding=3, text=artist)  # Artist with UTF-8 encoding
+        audio.save(padding=keep_padding, v1=0)  # v1=0 also removes any ID3v1 tag
 
 def clean_metadata(filepath, artist, title):
     """Clean and set metadata for flac or mp3 file."""
-    ext = os.path.splitext(filepath)[1].lower()
     try:
-        if ext == '.flac':
-            audio = FLAC(filepath)
-            audio.clear()
-            audio['title'] = title
-            if artist:
-                audio['artist'] = artist
-            audio.save()
-        elif ext == '.mp3':
-            audio = MP3(filepath)
-            audio.delete()  # Clear all tags
-            audio['TIT2'] = TIT2(encoding=3, text=title)  # Title with UTF-8 encoding
-            if artist:
-                audio['TPE1'] = TPE1(encoding=3, text=artist)  # Artist with UTF-8 encoding
-            audio.save()
+        audio = load_audio(filepath)
+        if audio is not None:
+            rewrite_tags(audio, artist, title)
         print(f"Updated metadata for: {filepath}")
     except Exception as e:
         print(f"Error updating {filepath}: {e}")
 
-def process_music_files(folder):
-    """Process all flac and mp3 files in the folder and subfolders."""
+def process_file(filepath, skip_clean=False, dry_run=False, clean=None):
+    """Clean one music file and return (result, message).
+
+    result is 'updated', 'clean', 'would_update' or 'error'.
+    clean is the is_clean() result when it is already known (e.g. from the catalog);
+    the file is then only opened to rewrite it.
+    """
+    artist, title = parse_filename(os.path.basename(filepath))
+    try:
+        if clean is None:
+            audio = load_audio(filepath)
+            clean = skip_clean and is_clean(audio, artist, title)
+        else:
+            audio = None
+        if skip_clean and clean:
+            return 'clean', f"Already clean: {filepath}"
+        if dry_run:
+            return 'would_update', f"Would update: {filepath}"
+        rewrite_tags(audio or load_audio(filepath), artist, title)
+        return 'updated', f"Updated metadata for: {filepath}"
+    except Exception as e:
+        return 'error', f"Error updating {filepath}: {e}"
+
+def _matches(path, patterns):
+    return any(fnmatch(path, pattern) for pattern in patterns)
+
+def iter_entries(folder, actions=(LRC, TAGS), include=(), exclude=()):
+    """Walk the folder once and yield (action, filepath) for every file that needs an action.
+
+    include/exclude are glob patterns matched against the path relative to folder,
+    with '/' as separator (e.g. '*.flac', 'Live/*'). A directory matching an exclude
+    pattern is not entered at all. With include patterns, only matching files are used.
+    """
     for root, dirs, files in os.walk(folder):
+        rel_root = os.path.relpath(root, folder).replace(os.sep, '/')
+        prefix = '' if rel_root == '.' else rel_root + '/'
+        if exclude:
+            dirs[:] = [d for d in dirs if not _matches(prefix + d, exclude)]
         for file in files:
-            if file.lower().endswith(('.flac', '.mp3')):
-                filepath = os.path.join(root, file)
-                artist, title = parse_filename(file)
-                clean_metadata(filepath, artist, title)
-
-def main():
-    if len(sys.argv) > 1:
-        folder = sys.argv[1]
+            lower = file.lower()
+            if lower.endswith('.lrc'):
+                action = LRC
+            elif lower.endswith(('.flac', '.mp3')):
+                action = TAGS
+            else:
+                continue
+            rel = prefix + file
+            if action not in actions or _matches(rel, exclude) or (include and not _matches(rel, include)):
+                continue
+            yield action, os.path.join(root, file)
+
+def _dispatch(entry, skip_clean, dry_run, catalog):
+    # Returns (filepath, result, message, catalog entry newly read from the file or None)
+    action, filepath = entry
+    if action == LRC:
+        return (filepath,) + delete_lrc(filepath, dry_run) + (None,)
+    if skip_clean and catalog is not None:
+        # Unchanged files are judged from the shared catalog without opening them
+        cataloged, fresh = catalog.current(os.path.relpath(filepath, catalog.root))
+        if cataloged is None or not cataloged.ok:
+            # Unreadable tags: let process_file report the error
+            return (filepath,) + process_file(filepath, skip_clean, dry_run) + (cataloged if fresh else None,)
+        # Changed files were just parsed by the catalog, so use that result instead of parsing again
+        return (filepath,) + process_file(filepath, skip_clean, dry_run, cataloged.is_clean) + (
+            cataloged if fresh else None,)
+    return (filepath,) + process_file(filepath, skip_clean, dry_run) + (None,)
+
+def run_pipeline(folder, actions=(LRC, TAGS), skip_clean=False, dry_run=False, workers=1, include=(), exclude=(),
+                 on_result=None, catalog=None):
+    """Delete .lrc files and rewrite tags in a single walk of the folder.
+
+    Entries are handed to a bounded worker pool while the walk is still running.
+    on_result(result, message) is called for every file as it finishes.
+    With a catalog (lineup_catalog.AudioCatalog for folder), skip_clean uses its records
+    for unchanged files, and the records of rewritten files are updated.
+    Returns (Counter of results, list of error messages, elapsed seconds).
+    """
+    started = time.monotonic()
+    summary = Counter()
+    errors = []
+
+    def record(outcome):
+        filepath, result, message, cataloged = outcome
+        summary[result] += 1
+        if result == 'error':
+            errors.append(message)
+        if catalog is not None:
+            if cataloged is not None:
+                catalog.put(cataloged)
+            if result == 'updated':
+                catalog.mark_rewritten(os.path.relpath(filepath, catalog.root))
+        if on_result is not None:
+            on_result(result, message)
+
+    entries = iter_entries(folder, actions, include, exclude)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for entry in entries:
+                pending.add(pool.submit(_dispatch, entry, skip_clean, dry_run, catalog))
+                if len(pending) >= workers * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+            for future in pending:
+                record(future.result())
     else:
+        for entry in entries:
+            record(_dispatch(entry, skip_clean, dry_run, catalog))
+    return summary, errors, time.monotonic() - started
+
+def process_music_files(folder, skip_clean=False, dry_run=False, workers=1):
+    """Process all flac and mp3 files in the folder and subfolders."""
+    return run_pipeline(folder, (TAGS,), skip_clean, dry_run, workers, on_result=print_result)
+
+def print_result(result, message):
+    print(message)
+
+def format_summary(summary, errors, seconds, dry_run=False):
+    total = sum(summary.values())
+    rate = total / seconds if seconds > 0 else 0.0
+    lines = [f"{'Dry run: ' if dry_run else ''}{total} files in {seconds:.1f} s ({rate:.0f} files/s)"]
+    for result, label in RESULT_LABELS.items():
+        if summary[result]:
+            lines.append(f"  {label}: {summary[result]}")
+    for message in errors:
+        lines.append(f"  {message}")
+    return "\n".join(lines)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Delete .lrc files and reset flac/mp3 tags from the file names.")
+    parser.add_argument("folder", nargs="?", help="folder to process (asked for when omitted)")
+    parser.add_argument("--skip-clean", action="store_true",
+                        help="leave files whose tags already match the file name untouched")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only report what would be changed")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="number of files rewritten at the same time")
+    parser.add_argument("-y", "--yes", action="store_true", help="do not ask for confirmation")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB",
+                        help="only process files whose relative path matches (repeatable)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="skip files and folders whose relative path matches (repeatable)")
+    parser.add_argument("--catalog", action="store_true",
+                        help="with --skip-clean, use the tag catalog shared with lineup and check.py to skip "
+                             "unchanged clean files without opening them")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print a line for every file")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    folder = args.folder
+    if folder is None:
         folder = input("Enter the folder path to process: ").strip()
     
     if not os.path.isdir(folder):
         print("Invalid folder path.")
         return
     
-    confirm = input("This will delete all .lrc files and modify metadata of flac/mp3 files. Confirm? (y/n): ").strip().lower()
-    if confirm != 'y':
-        print("Operation cancelled.")
-        return
+    if not args.dry_run and not args.yes:
+        confirm = input("This will delete all .lrc files and modify metadata of flac/mp3 files. Confirm? (y/n): ").strip().lower()
+        if confirm != 'y':
+            print("Operation cancelled.")
+            return
     
-    print("Deleting .lrc files...")
-    delete_lrc_files(folder)
-    
-    print("Processing music files...")
-    process_music_files(folder)
+    # Printing every file is slow on some terminals, so by default only the summary is shown
+    catalog = AudioCatalog(folder) if args.catalog else None
+    try:
+        summary, errors, seconds = run_pipeline(
+            folder, skip_clean=args.skip_clean, dry_run=args.dry_run, workers=args.workers,
+            include=args.include, exclude=args.exclude, on_result=print_result if args.verbose else None,
+            catalog=catalog)
+    finally:
+        if catalog is not None:
+            catalog.close()
+    print(format_summary(summary, errors, seconds, args.dry_run))
     
     print("Done.")
 
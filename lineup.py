@@ -1,18 +1,115 @@
 import os
 import sys
-import shutil
-import re
-import difflib
-import json
-from pathlib import Path
+import time
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
 from tkinter import scrolledtext
 from tkinter import ttk
-import openpyxl
 import webbrowser
+from itertools import islice
+
+from lineup_core import (LineupConfig, MatchPlan, Cancelled, prepare_plan, apply_plan, load_index, preview_rows,
+                         generate_new_name)
+from lineup_copy import format_size
+from lineup_lists import LIST_FILETYPES, iter_list_file
+from lineup_metrics import RunMetrics, profiled
+from lineup_rename import latest_journal, undo_renames
+
+class LazyTable:
+    """只在滚动到时才插入行的表格。
+
+    所有行保存在内存的列表中，过滤和排序都在列表上完成，Treeview 中只插入
+    已经滚动到的部分，因此几万行的预览也能立即显示。
+    """
+    CHUNK = 300
+
+    def __init__(self, parent, columns, rows, score_column=None):
+        # columns 是 [(标题, 宽度)]；score_column 是相似度所在的列，提供时可以按最低相似度过滤
+        self.rows = rows
+        self.view = rows
+        self.loaded = 0
+        self.score_column = score_column
+        self.sort_column = None
+        self.sort_desc = False
+        
+        self.frame = ttk.Frame(parent, style='Card.TFrame')
+        filter_frame = ttk.Frame(self.frame, style='Card.TFrame')
+        filter_frame.pack(fill="x", pady=(0, 5))
+        ttk.Label(filter_frame, text="筛选:").pack(side=tk.LEFT, padx=(0, 5))
+        self.filter_var = tk.StringVar()
+        ttk.Entry(filter_frame, textvariable=self.filter_var, width=30).pack(side=tk.LEFT, padx=(0, 15))
+        self.min_score = tk.DoubleVar(value=0.0)
+        if score_column is not None:
+            ttk.Label(filter_frame, text="相似度 ≥").pack(side=tk.LEFT, padx=(0, 5))
+            ttk.Spinbox(filter_frame, from_=0.0, to=1.0, increment=0.05, textvariable=self.min_score,
+                        width=6, command=self.refresh).pack(side=tk.LEFT)
+        self.count_label = ttk.Label(filter_frame, text="")
+        self.count_label.pack(side=tk.RIGHT)
+        self.filter_var.trace("w", lambda *args: self.refresh())
+        
+        table_frame = ttk.Frame(self.frame, style='Card.TFrame')
+        table_frame.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(table_frame, columns=list(range(len(columns))), show="headings")
+        for n, (title, width) in enumerate(columns):
+            self.tree.heading(n, text=title, command=lambda n=n: self.sort_by(n))
+            self.tree.column(n, width=width)
+        self.scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.pack(side=tk.LEFT, fill="both", expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill="y")
+        self.refresh()
+    
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # 接近底部时再插入一批
+        if float(last) > 0.9 and self.loaded < len(self.view):
+            self.load_more()
+    
+    def load_more(self):
+        end = min(self.loaded + self.CHUNK, len(self.view))
+        for row in self.view[self.loaded:end]:
+            self.tree.insert("", tk.END, values=row)
+        self.loaded = end
+    
+    def sort_by(self, column):
+        # 第一次点击相似度列时从高到低排序，其他列从小到大，再次点击反向
+        if self.sort_column == column:
+            self.sort_desc = not self.sort_desc
+        else:
+            self.sort_column = column
+            self.sort_desc = column == self.score_column
+        self.refresh()
+    
+    def refresh(self):
+        rows = self.rows
+        text = self.filter_var.get().strip().casefold()
+        if text:
+            rows = [row for row in rows if any(text in str(value).casefold() for value in row)]
+        if self.score_column is not None:
+            try:
+                min_score = self.min_score.get()
+            except tk.TclError:
+                min_score = 0.0
+            if min_score > 0:
+                rows = [row for row in rows if row[self.score_column] >= min_score]
+        if self.sort_column is not None:
+            rows = sorted(rows, key=lambda row: row[self.sort_column], reverse=self.sort_desc)
+        self.view = rows
+        self.tree.delete(*self.tree.get_children())
+        self.loaded = 0
+        self.load_more()
+        self.count_label.config(text=f"显示 {len(rows)} / {len(self.rows)}")
+
 
 class LineupApp:
+    # 导入列表后在文本框中显示的项数
+    LIST_PREVIEW_LINES = 200
+    # 主线程检查后台任务消息的间隔（毫秒），以及后台线程发送进度的最小间隔（秒）
+    POLL_MS = 100
+    PROGRESS_INTERVAL = 0.1
+
     def __init__(self, root):
         self.root = root
         self.root.title("文件排序器")
@@ -30,6 +127,8 @@ class LineupApp:
         
         self.folder_path = ""
         self.list_items = []
+        self.list_path = None  # 导入的列表文件，运行时逐行读取
+        self.list_excel = False  # 以 Excel 方式导入时，不论扩展名都按工作簿读取
         self.similarity_threshold = 0.6  # 初始化相似度阈值
         self.auto_select_highest = tk.BooleanVar(value=False)
         self.generate_list_only = tk.BooleanVar(value=False)
@@ -38,6 +137,14 @@ class LineupApp:
         self.filename_format = tk.StringVar(value="relative")
         self.output_folder = ""
         self.output_file = ""
+        self.last_plan = None
+        
+        # 匹配和复制在后台线程中运行，通过队列把进度和对话框请求交给主线程
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
+        self.task_started = 0.0
+        self.last_report = 0.0
         
         self.rename_mode = tk.StringVar(value="add_prefix")
         self.separator = tk.StringVar(value="-")
@@ -146,13 +253,38 @@ class LineupApp:
         self.auto_select_highest = tk.BooleanVar(value=False)
         ttk.Checkbutton(options_frame, text="自动选择最高相似度", variable=self.auto_select_highest).pack(side=tk.LEFT, padx=(0, 20))
         self.generate_list_only = tk.BooleanVar(value=False)
-        ttk.Checkbutton(options_frame, text="仅生成列表", variable=self.generate_list_only).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text="仅生成列表", variable=self.generate_list_only).pack(side=tk.LEFT, padx=(0, 20))
+        self.in_place = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="原地重命名（不复制，可撤销）", variable=self.in_place).pack(side=tk.LEFT)
+        
+        # 输出方式
+        link_frame = ttk.Frame(quick_frame, style='Card.TFrame')
+        link_frame.pack(fill="x", pady=(10, 0))
+        ttk.Label(link_frame, text="输出方式:").pack(side=tk.LEFT, padx=(0, 10))
+        self.link_mode = tk.StringVar(value="copy")
+        ttk.Radiobutton(link_frame, text="复制", variable=self.link_mode, value="copy").pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Radiobutton(link_frame, text="硬链接", variable=self.link_mode, value="hardlink").pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Radiobutton(link_frame, text="符号链接", variable=self.link_mode, value="symlink").pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Radiobutton(link_frame, text="Reflink 克隆", variable=self.link_mode, value="reflink").pack(side=tk.LEFT)
         
         # 操作按钮
         button_frame = ttk.Frame(main_container, style='Card.TFrame')
         button_frame.pack(fill="x", pady=(0, 15))
         ttk.Button(button_frame, text="🔍 预览", command=self.preview, style='Accent.TButton').pack(side=tk.LEFT, padx=(0, 20))
         ttk.Button(button_frame, text="▶️ 运行", command=self.run_lineup, style='Accent.TButton').pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="📂 执行计划", command=self.apply_saved_plan).pack(side=tk.RIGHT)
+        ttk.Button(button_frame, text="💾 保存计划", command=self.save_plan).pack(side=tk.RIGHT, padx=(0, 10))
+        ttk.Button(button_frame, text="↩️ 撤销重命名", command=self.undo_rename).pack(side=tk.RIGHT, padx=(0, 10))
+        
+        # 进度
+        progress_frame = ttk.Frame(main_container, style='Card.TFrame')
+        progress_frame.pack(fill="x", pady=(0, 15))
+        self.progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", mode="determinate", maximum=1.0)
+        self.progress_bar.pack(side=tk.LEFT, fill="x", expand=True, padx=(0, 10))
+        self.cancel_button = ttk.Button(progress_frame, text="取消", command=self.cancel_task, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT)
+        self.progress_label = ttk.Label(main_container, text="")
+        self.progress_label.pack(anchor="w", pady=(0, 10))
         
         # 结果显示区域
         result_frame = ttk.LabelFrame(main_container, text="📊 结果", style='Card.TFrame', padding=10)
@@ -242,6 +374,48 @@ class LineupApp:
         
         self.ignore_directories = tk.BooleanVar(value=False)
         ttk.Checkbutton(other_frame, text="忽略目录（只处理文件）", variable=self.ignore_directories).pack(anchor="w")
+        self.cache_index = tk.BooleanVar(value=True)
+        ttk.Checkbutton(other_frame, text="缓存文件夹索引（文件夹未变化时不再重新读取）", variable=self.cache_index).pack(anchor="w")
+        self.recursive = tk.BooleanVar(value=False)
+        ttk.Checkbutton(other_frame, text="递归扫描子文件夹中的文件", variable=self.recursive).pack(anchor="w")
+        self.normalize = tk.BooleanVar(value=True)
+        ttk.Checkbutton(other_frame, text="规范化名称（全半角、大小写、括号、扩展名不同也视为完全匹配）",
+                        variable=self.normalize).pack(anchor="w")
+        self.to_simplified = tk.BooleanVar(value=False)
+        ttk.Checkbutton(other_frame, text="繁体转简体后比较（需要安装 opencc）", variable=self.to_simplified).pack(anchor="w")
+        self.match_tags = tk.BooleanVar(value=False)
+        ttk.Checkbutton(other_frame, text="音乐文件按标签中的“艺术家-标题”匹配（需要安装 mutagen）",
+                        variable=self.match_tags).pack(anchor="w")
+        
+        roots_frame = ttk.Frame(other_frame, style='Card.TFrame')
+        roots_frame.pack(fill="x", pady=(10, 0))
+        ttk.Label(roots_frame, text="其他源文件夹:").pack(side=tk.LEFT, padx=(0, 10))
+        self.extra_folders_entry = ttk.Entry(roots_frame, width=40)
+        self.extra_folders_entry.pack(side=tk.LEFT, fill="x", expand=True, padx=(0, 10))
+        ttk.Button(roots_frame, text="添加", command=self.add_extra_folder).pack(side=tk.RIGHT)
+        
+        scorer_frame = ttk.Frame(other_frame, style='Card.TFrame')
+        scorer_frame.pack(fill="x", pady=(10, 0))
+        ttk.Label(scorer_frame, text="打分方式:").pack(side=tk.LEFT, padx=(0, 10))
+        self.scorer = tk.StringVar(value="difflib")
+        ttk.Radiobutton(scorer_frame, text="逐项精确", variable=self.scorer, value="difflib").pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Radiobutton(scorer_frame, text="NumPy 批量（大型文件夹，需要 numpy）", variable=self.scorer, value="numpy").pack(side=tk.LEFT)
+        
+        assignment_frame = ttk.Frame(other_frame, style='Card.TFrame')
+        assignment_frame.pack(fill="x", pady=(10, 0))
+        ttk.Label(assignment_frame, text="分配方式:").pack(side=tk.LEFT, padx=(0, 10))
+        self.assignment = tk.StringVar(value="sequential")
+        ttk.Radiobutton(assignment_frame, text="按列表顺序", variable=self.assignment, value="sequential").pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Radiobutton(assignment_frame, text="全局分配（完全匹配优先）", variable=self.assignment, value="global").pack(side=tk.LEFT)
+        
+        workers_frame = ttk.Frame(other_frame, style='Card.TFrame')
+        workers_frame.pack(fill="x", pady=(10, 0))
+        ttk.Label(workers_frame, text="并行进程数 (0 为全部核心):").pack(side=tk.LEFT, padx=(0, 5))
+        self.workers = tk.IntVar(value=1)
+        ttk.Entry(workers_frame, textvariable=self.workers, width=5).pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Label(workers_frame, text="同时复制文件数:").pack(side=tk.LEFT, padx=(0, 5))
+        self.copy_workers = tk.IntVar(value=4)
+        ttk.Entry(workers_frame, textvariable=self.copy_workers, width=5).pack(side=tk.LEFT)
     
     def setup_about_frame(self):
         about_group = ttk.LabelFrame(self.about_frame, text="关于文件排序器", style='Card.TFrame', padding=10)
@@ -285,17 +459,7 @@ GitHub: https://github.com/GZYZhy/zh-lineup
         self.similarity_threshold = self.threshold_var.get()
     
     def generate_new_name(self, num, item):
-        if self.rename_mode.get() == "add_prefix":
-            separator = self.separator.get()
-            return f"{num}{separator}{item}"
-        else:
-            format_str = self.format_str.get()
-            base = format_str.replace("[Num]", str(num))
-            # 过滤特殊字符
-            base = re.sub(r'[<>:"|?*\\/]', '', base)
-            # 保留扩展名
-            name, ext = os.path.splitext(item)
-            return base + ext
+        return generate_new_name(self.build_config(), num, item)
     
     def select_folder(self):
         self.folder_path = filedialog.askdirectory()
@@ -309,6 +473,14 @@ GitHub: https://github.com/GZYZhy/zh-lineup
             self.output_folder_entry.delete(0, tk.END)
             self.output_folder_entry.insert(0, self.output_folder)
     
+    def add_extra_folder(self):
+        # 多个文件夹用路径分隔符隔开，排在前面的优先
+        folder = filedialog.askdirectory()
+        if folder:
+            current = self.extra_folders_entry.get().strip()
+            self.extra_folders_entry.delete(0, tk.END)
+            self.extra_folders_entry.insert(0, current + os.pathsep + folder if current else folder)
+    
     def select_output_file(self):
         output_format = self.output_format.get()
         if output_format == "text":
@@ -333,27 +505,35 @@ GitHub: https://github.com/GZYZhy/zh-lineup
     def import_list(self):
         mode = self.list_mode.get()
         if mode == "file":
-            path = filedialog.askopenfilename(filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")])
-            if path:
-                with open(path, 'r', encoding='utf-8') as f:
-                    self.list_items = [line.strip() for line in f if line.strip()]
-                self.manual_text.delete(1.0, tk.END)
-                self.manual_text.insert(tk.END, '\n'.join(self.list_items))
+            path = filedialog.askopenfilename(filetypes=LIST_FILETYPES)
         elif mode == "excel":
             path = filedialog.askopenfilename(filetypes=[("Excel文件", "*.xlsx"), ("所有文件", "*.*")])
-            if path:
-                wb = openpyxl.load_workbook(path)
-                sheet = wb.active
-                self.list_items = [str(cell.value).strip() for cell in sheet['A'] if cell.value is not None]
-                self.manual_text.delete(1.0, tk.END)
-                self.manual_text.insert(tk.END, '\n'.join(self.list_items))
-        # For manual, list_items will be read from text box
+        else:
+            return  # For manual, list_items will be read from text box
+        if not path:
+            return
+        # 只在文本框中显示开头部分，运行时再从文件逐行读取，大列表也不会占满内存
+        excel = mode == "excel"
+        try:
+            head = list(islice(iter_list_file(path, excel), self.LIST_PREVIEW_LINES + 1))
+        except Exception as e:
+            messagebox.showerror("错误", f"无法读取列表文件: {e}")
+            return
+        self.list_path = path
+        self.list_excel = excel
+        self.manual_text.delete(1.0, tk.END)
+        self.manual_text.insert(tk.END, '\n'.join(head[:self.LIST_PREVIEW_LINES]))
+        if len(head) > self.LIST_PREVIEW_LINES:
+            self.manual_text.insert(tk.END, f"\n……（仅显示前 {self.LIST_PREVIEW_LINES} 项，运行时读取整个文件）")
     
     def get_list_items(self):
         if self.list_mode.get() == "manual":
             text = self.manual_text.get(1.0, tk.END).strip()
             self.list_items = [line.strip() for line in text.split('\n') if line.strip()]
-        return self.list_items
+            return self.list_items
+        if self.list_path is None:
+            return None
+        return iter_list_file(self.list_path, self.list_excel)
     
     def preview(self):
         folder = self.folder_entry.get()
@@ -370,33 +550,31 @@ GitHub: https://github.com/GZYZhy/zh-lineup
             messagebox.showerror("错误", "请提供目的列表")
             return
         
+        config = self.build_config()
+        self.start_task(lambda: self.process_lineup(folder, items, config, preview=True), self.show_preview)
+    
+    def show_preview(self, result):
+        (matched, missed, unused), summary = result
+        self.result_text.insert(tk.END, summary)
         # 创建预览弹窗
         preview_dialog = tk.Toplevel(self.root)
         preview_dialog.title("预览结果")
-        preview_dialog.geometry("600x500")
+        preview_dialog.geometry("800x600")
         preview_dialog.configure(bg='#f0f0f0')
         
         ttk.Label(preview_dialog, text="预览结果", font=('Microsoft YaHei', 14, 'bold')).pack(pady=10)
         
-        text_frame = ttk.Frame(preview_dialog, style='Card.TFrame')
-        text_frame.pack(fill="both", expand=True, padx=10, pady=10)
-        
-        preview_text = tk.Text(text_frame, height=20, width=70, font=('Microsoft YaHei', 10), wrap=tk.WORD)
-        scrollbar = ttk.Scrollbar(text_frame, orient=tk.VERTICAL, command=preview_text.yview)
-        preview_text.configure(yscrollcommand=scrollbar.set)
-        preview_text.pack(side=tk.LEFT, fill="both", expand=True, padx=10, pady=10)
-        scrollbar.pack(side=tk.RIGHT, fill="y")
-        
-        preview_text.insert(tk.END, "正在生成预览...\n")
-        preview_dialog.update()
-        
-        try:
-            result = self.process_lineup(folder, items, preview=True)
-            preview_text.delete(1.0, tk.END)
-            preview_text.insert(tk.END, result)
-        except Exception as e:
-            preview_text.delete(1.0, tk.END)
-            preview_text.insert(tk.END, f"错误: {str(e)}")
+        tabs = ttk.Notebook(preview_dialog)
+        tabs.pack(fill="both", expand=True, padx=10, pady=10)
+        tables = (
+            (f"匹配的项目 ({len(matched)})", [("序号", 50), ("新名称", 250), ("原项目", 220), ("行号", 50), ("相似度", 60), ("类型", 50)],
+             matched, 4),
+            (f"未匹配 ({len(missed)})", [("行号", 60), ("列表项", 500)], missed, None),
+            (f"未使用 ({len(unused)})", [("项目", 500), ("类型", 60)], unused, None),
+        )
+        for title, columns, table_rows, score_column in tables:
+            table = LazyTable(tabs, columns, table_rows, score_column)
+            tabs.add(table.frame, text=title)
         
         ttk.Button(preview_dialog, text="关闭", command=preview_dialog.destroy).pack(pady=10)
     
@@ -417,271 +595,352 @@ GitHub: https://github.com/GZYZhy/zh-lineup
         
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, "正在处理...\n")
-        self.root.update()
+        config = self.build_config()
+        self.start_task(lambda: self.process_lineup(folder, items, config, preview=False),
+                        lambda result: self.result_text.insert(tk.END, result))
+    
+    def build_config(self):
+        return LineupConfig(
+            similarity_threshold=self.similarity_threshold,
+            auto_select_highest=self.auto_select_highest.get(),
+            generate_list_only=self.generate_list_only.get(),
+            ignore_directories=self.ignore_directories.get(),
+            output_format=self.output_format.get(),
+            filename_format=self.filename_format.get(),
+            output_folder=self.output_folder_entry.get().strip(),
+            rename_mode=self.rename_mode.get(),
+            separator=self.separator.get(),
+            format_str=self.format_str.get(),
+            start_num=self.start_num.get(),
+            step=self.step.get(),
+            reverse=self.reverse.get(),
+            end_num=self.end_num.get(),
+            scorer=self.scorer.get(),
+            workers=self.workers.get(),
+            assignment=self.assignment.get(),
+            copy_workers=self.copy_workers.get(),
+            link_mode=self.link_mode.get(),
+            cache_index=self.cache_index.get(),
+            recursive=self.recursive.get(),
+            normalize=self.normalize.get(),
+            to_simplified=self.to_simplified.get(),
+            match_tags=self.match_tags.get(),
+            extra_folders=[f.strip() for f in self.extra_folders_entry.get().split(os.pathsep) if f.strip()],
+            in_place=self.in_place.get(),
+        )
+    
+    def process_lineup(self, folder, lines, config, preview=False):
+        """在后台线程中运行，对话框通过 call_in_ui 交给主线程。"""
+        # 预览生成的匹配计划会保存下来，运行时文件夹和设置未变化就直接使用，不再重新匹配和询问
+        metrics = RunMetrics()
+        with profiled():
+            index, plan = prepare_plan(
+                folder, lines, config,
+                plan=self.last_plan, line_progress=self.report_lines,
+                review=lambda requests: self.call_in_ui(self.review_candidates, requests),
+                metrics=metrics,
+            )
+            # 导入的列表文件在读取之后才知道是否为空
+            if not plan.lines:
+                raise ValueError("请提供目的列表")
+            self.last_plan = plan
+            if preview:
+                return preview_rows(index, plan), metrics.summary()
+            return self.apply_in_worker(plan, config, index, metrics)
+    
+    def apply_in_worker(self, plan, config, index, metrics=None):
+        return apply_plan(
+            plan, config, index,
+            confirm=lambda message: self.call_in_ui(messagebox.askyesno, "确认", message),
+            ask_string=lambda title, prompt: self.call_in_ui(simpledialog.askstring, title, prompt),
+            progress=self.report_copy,
+            metrics=metrics,
+        )
+    
+    # ---- 后台任务 ----
+    
+    def start_task(self, func, on_done):
+        """在后台线程中运行 func()，完成后在主线程中调用 on_done(结果)。"""
+        if self.worker is not None and self.worker.is_alive():
+            messagebox.showinfo("提示", "上一个任务还在运行")
+            return
+        self.cancel_event.clear()
+        self.task_started = time.monotonic()
+        self.last_report = 0.0
+        self.progress_bar["value"] = 0
+        self.progress_label.config(text="正在准备...")
+        self.cancel_button.config(state=tk.NORMAL)
+        
+        def run():
+            try:
+                self.events.put(("done", on_done, func()))
+            except Cancelled:
+                self.events.put(("cancelled", None, None))
+            except Exception as e:
+                self.events.put(("error", None, e))
+        
+        self.worker = threading.Thread(target=run, daemon=True)
+        self.worker.start()
+        self.root.after(self.POLL_MS, self.poll_events)
+    
+    def poll_events(self):
+        progress = None
+        while True:
+            try:
+                kind, callback, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                progress = payload  # 只显示最新的进度
+            elif kind == "call":
+                func, args, reply = payload
+                try:
+                    reply.put((True, func(*args)))
+                except Exception as e:
+                    reply.put((False, e))
+            else:
+                self.finish_task(kind, callback, payload)
+                return
+        if progress is not None:
+            self.show_progress(*progress)
+        self.root.after(self.POLL_MS, self.poll_events)
+    
+    def finish_task(self, kind, callback, payload):
+        self.cancel_button.config(state=tk.DISABLED)
+        if kind == "done":
+            self.progress_bar["value"] = 1.0
+            self.progress_label.config(text=f"完成，用时 {time.monotonic() - self.task_started:.1f} 秒")
+            callback(payload)
+        elif kind == "cancelled":
+            self.progress_label.config(text="已取消")
+            self.result_text.insert(tk.END, "操作已取消。\n")
+        else:
+            self.progress_label.config(text="出错")
+            messagebox.showerror("错误", str(payload))
+    
+    def call_in_ui(self, func, *args):
+        """从后台线程调用，在主线程中执行 func(*args) 并等待结果。"""
+        reply = queue.Queue(maxsize=1)
+        self.events.put(("call", None, (func, args, reply)))
+        ok, value = reply.get()
+        if not ok:
+            raise value
+        return value
+    
+    def cancel_task(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_label.config(text="正在取消，当前项目完成后停止...")
+    
+    def _post_progress(self, progress, final):
+        # 在后台线程中调用：检查是否已取消，并限制发给主线程的进度消息数量
+        if self.cancel_event.is_set():
+            raise Cancelled()
+        now = time.monotonic()
+        if final or now - self.last_report >= self.PROGRESS_INTERVAL:
+            self.last_report = now
+            self.events.put(("progress", None, progress))
+    
+    def report_lines(self, done, total):
+        elapsed = time.monotonic() - self.task_started
+        eta = elapsed * (total - done) / done if done else None
+        self._post_progress(("打分", f"{done}/{total} 行", done / total if total else 1.0, eta), done == total)
+    
+    def report_copy(self, stats):
+        total = max(stats.total_bytes, stats.processed)
+        self._post_progress(
+            ("复制", f"{format_size(stats.processed)} / {format_size(total)}，{stats.files} 个文件",
+             stats.processed / total if total else 1.0, stats.eta),
+            False,
+        )
+    
+    def show_progress(self, phase, detail, fraction, eta):
+        self.progress_bar["value"] = fraction
+        text = f"{phase}: {detail}"
+        if eta is not None:
+            text += f"，剩余约 {eta:.0f} 秒"
+        if self.cancel_event.is_set():
+            text += "（正在取消）"
+        self.progress_label.config(text=text)
+    
+    def save_plan(self):
+        if self.last_plan is None:
+            messagebox.showerror("错误", "请先预览或运行以生成匹配计划")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")])
+        if path:
+            self.last_plan.save(path)
+            self.result_text.insert(tk.END, f"匹配计划已保存到 {path}\n")
+    
+    def apply_saved_plan(self):
+        path = filedialog.askopenfilename(filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            plan = MatchPlan.load(path)
+        except Exception as e:
+            messagebox.showerror("错误", str(e))
+            return
+        
+        def apply_saved():
+            metrics = RunMetrics()
+            with metrics.phase("listing"):
+                index = load_index(plan.folder, plan.config)
+            metrics.plan_reused = True
+            metrics.matched = len(plan.matched)
+            return self.apply_in_worker(plan, plan.config, index, metrics)
         
+        self.start_task(apply_saved, lambda result: self.result_text.insert(tk.END, result))
+    
+    def undo_rename(self):
+        folder = self.folder_entry.get()
+        # 默认选中文件夹中最新的撤销记录
+        latest = latest_journal(folder) if folder else None
+        path = filedialog.askopenfilename(initialdir=folder or None,
+                                          initialfile=os.path.basename(latest) if latest else None,
+                                          filetypes=[("撤销记录", "*.json"), ("所有文件", "*.*")])
+        if not path:
+            return
+        if not messagebox.askyesno("确认", "确定要恢复原地重命名之前的名称吗？"):
+            return
         try:
-            result = self.process_lineup(folder, items, preview=False)
-            self.result_text.insert(tk.END, result)
+            count = undo_renames(path)
+            self.last_plan = None
+            self.result_text.insert(tk.END, f"已恢复 {count} 个项目的原名称\n")
         except Exception as e:
             messagebox.showerror("错误", str(e))
     
-    def process_lineup(self, folder, lines, preview=False):
-        output_format = self.output_format.get()
-        filename_format = self.filename_format.get()
-        
-        if output_format == "text":
-            result_file = "Result.txt"
-        elif output_format == "json":
-            result_file = "Result.json"
-        elif output_format == "m3u":
-            result_file = "Result.m3u"
+    def review_candidates(self, requests):
+        """一次审阅所有有多个候选的行。requests 是 [(行号, 行内容, 候选)]，返回 {行号: 选中的项目}。"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"选择匹配文件 - 共 {len(requests)} 行需要确认")
+        dialog.geometry("800x600")
+        dialog.configure(bg='#f0f0f0')
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        ttk.Label(dialog, text="↑/↓ 切换行，1-9 选择候选，0 或 Delete 跳过，←/→ 切换候选，Enter 完成",
+                  font=('Microsoft YaHei', 10)).pack(pady=(10, 0))
+        
+        choices = {}  # 行号 -> 候选下标，未出现表示跳过
+        by_line = {line_no: (item, candidates) for line_no, item, candidates in requests}
+        
+        table_frame = ttk.Frame(dialog, style='Card.TFrame')
+        table_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        tree = ttk.Treeview(table_frame, columns=("line", "item", "choice", "sim"), show="headings", selectmode="browse")
+        for column, text, width in (("line", "行号", 60), ("item", "列表项", 260), ("choice", "选择", 320), ("sim", "相似度", 70)):
+            tree.heading(column, text=text)
+            tree.column(column, width=width, stretch=column in ("item", "choice"))
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=tk.LEFT, fill="both", expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
         
-        def get_filename(item, base_dir):
-            if filename_format == "absolute":
-                return os.path.join(base_dir, item)
-            else:
-                return item
+        listbox = tk.Listbox(dialog, height=6, font=('Microsoft YaHei', 10), selectbackground='#cce7ff', exportselection=False)
+        listbox.pack(fill="x", padx=10)
         
-        # 获取项目
-        if self.ignore_directories.get():
-            items = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-        else:
-            items = os.listdir(folder)
-        
-        matched = []
-        missed = []
-        
-        for i, item in enumerate(lines, 1):
-            # 移除括号
-            clean_item = re.sub(r'\([^)]*\)', '', item).strip()
-            
-            # 计算相似度
-            candidates = []
-            perfect_match = None
-            for it in items:
-                similarity = difflib.SequenceMatcher(None, clean_item, it).ratio()
-                if similarity == 1.0:
-                    perfect_match = it
-                    break  # 找到完全匹配，直接使用
-                elif similarity > self.similarity_threshold:
-                    candidates.append((it, similarity))
-            
-            if perfect_match:
-                matched_item = perfect_match
-            elif candidates:
-                # 按相似度排序
-                candidates.sort(key=lambda x: x[1], reverse=True)
-                
-                if len(candidates) == 1 or self.auto_select_highest.get():
-                    matched_item = candidates[0][0]
-                else:
-                    # 多个候选，弹出选择对话框
-                    choice = self.select_candidate(item, candidates)
-                    if choice is None:
-                        missed.append((i, item))
-                        continue
-                    matched_item = choice
+        def refresh(line_no):
+            item, candidates = by_line[line_no]
+            if line_no in choices:
+                file, sim = candidates[choices[line_no]]
+                tree.item(str(line_no), values=(line_no, item, file, f"{sim:.2f}"))
             else:
-                missed.append((i, item))
-                continue
-            
-            matched.append((i, matched_item))
-            items.remove(matched_item)
-        
-        unused = items
-        
-        # 计算序号
-        len_matched = len(matched)
-        if self.reverse.get():
-            end = self.end_num.get()
-            nums = [end - i * self.step.get() for i in range(len_matched)]
-        else:
-            start = self.start_num.get()
-            nums = [start + i * self.step.get() for i in range(len_matched)]
-        
-        if preview:
-            result = "预览结果:\n\n"
-            result += "匹配的项目:\n"
-            for idx, (orig_idx, item) in enumerate(matched, 1):
-                num = nums[idx-1]
-                new_name = self.generate_new_name(num, item)
-                item_type = "目录" if os.path.isdir(os.path.join(folder, item)) else "文件"
-                result += f"{idx}. {new_name} ({item_type})\n"
-            result += "\n"
-            if missed:
-                result += f"未匹配的项目 (总共 {len(missed)} 个):\n"
-                for orig_idx, item in missed:
-                    result += f"  - {item} (第 {orig_idx} 行)\n"
-                result += "\n"
-            if unused:
-                result += f"文件夹中未使用的项目 (总共 {len(unused)} 个):\n"
-                for u in unused:
-                    item_type = "目录" if os.path.isdir(os.path.join(folder, u)) else "文件"
-                    result += f"  - {u} ({item_type})\n"
-            return result
-        
-        # 如果仅生成列表
-        if self.generate_list_only.get():
-            if self.output_folder_entry.get().strip():
-                result_dir = self.output_folder_entry.get().strip()
-                result_list_path = os.path.join(result_dir, result_file)
-            else:
-                result_dir = folder
-                result_list_path = os.path.join(result_dir, result_file)
-        else:
-            if self.output_folder_entry.get().strip():
-                result_dir = self.output_folder_entry.get().strip()
-                result_list_path = os.path.join(result_dir, result_file)
+                tree.item(str(line_no), values=(line_no, item, "（跳过）", ""))
+        
+        def current():
+            focus = tree.focus()
+            return int(focus) if focus else None
+        
+        def show_candidates(event=None):
+            line_no = current()
+            listbox.delete(0, tk.END)
+            if line_no is None:
+                return
+            for n, (file, sim) in enumerate(by_line[line_no][1], 1):
+                listbox.insert(tk.END, f"{n}. {file} (相似度: {sim:.2f})")
+            if line_no in choices:
+                listbox.selection_set(choices[line_no])
+                listbox.see(choices[line_no])
+        
+        def choose(line_no, idx):
+            if idx is None:
+                choices.pop(line_no, None)
+            elif 0 <= idx < len(by_line[line_no][1]):
+                choices[line_no] = idx
+            refresh(line_no)
+            show_candidates()
+        
+        def on_key(event):
+            line_no = current()
+            if line_no is None:
+                return
+            if event.char.isdigit():
+                choose(line_no, None if event.char == "0" else int(event.char) - 1)
+            elif event.keysym == "Delete":
+                choose(line_no, None)
+            elif event.keysym in ("Left", "Right"):
+                count = len(by_line[line_no][1])
+                idx = choices.get(line_no, -1 if event.keysym == "Right" else 0)
+                choose(line_no, (idx + (1 if event.keysym == "Right" else -1)) % count)
             else:
-                result_dir = os.path.join(folder, 'Result')
-                # 检查是否存在Result文件夹
-                if os.path.exists(result_dir):
-                    choice = messagebox.askyesno("确认", f"选择的文件夹中已存在 'Result' 文件夹。\n\n选择 '是' 以覆盖该文件夹，选择 '否' 将其当作排序项目并指定新的输出文件夹名称。")
-                    if not choice:
-                        # 要求输入新的输出文件夹名称
-                        new_name = simpledialog.askstring("输入新的输出文件夹名称", "请输入新的输出文件夹名称:")
-                        if new_name and new_name.strip():
-                            result_dir = os.path.join(folder, new_name.strip())
-                            result_list_path = os.path.join(result_dir, result_file)
-                        else:
-                            return "操作已取消。"
-                    else:
-                        result_list_path = os.path.join(result_dir, result_file)
+                return
+            return "break"
+        
+        def on_listbox(event=None):
+            line_no = current()
+            if line_no is not None and listbox.curselection():
+                choose(line_no, listbox.curselection()[0])
+        
+        for line_no, item, candidates in requests:
+            tree.insert("", tk.END, iid=str(line_no))
+            refresh(line_no)
+        tree.bind("<<TreeviewSelect>>", show_candidates)
+        tree.bind("<Key>", on_key)
+        listbox.bind("<<ListboxSelect>>", on_listbox)
+        
+        # 批量操作
+        bulk_frame = ttk.Frame(dialog, style='Card.TFrame')
+        bulk_frame.pack(fill="x", padx=10, pady=(10, 0))
+        ttk.Label(bulk_frame, text="首选相似度不低于").pack(side=tk.LEFT)
+        bulk_threshold = tk.DoubleVar(value=max(self.similarity_threshold, 0.8))
+        ttk.Spinbox(bulk_frame, from_=0.0, to=1.0, increment=0.05, textvariable=bulk_threshold, width=6).pack(side=tk.LEFT, padx=5)
+        
+        def accept_above():
+            try:
+                limit = bulk_threshold.get()
+            except tk.TclError:
+                return
+            for line_no, item, candidates in requests:
+                if candidates[0][1] >= limit:
+                    choices[line_no] = 0
+                    refresh(line_no)
+            show_candidates()
+        
+        def set_all(idx):
+            for line_no, item, candidates in requests:
+                if idx is None:
+                    choices.pop(line_no, None)
                 else:
-                    result_list_path = os.path.join(result_dir, result_file)
-        
-        # 检查输出文件是否已存在
-        if os.path.exists(result_list_path):
-            choice = messagebox.askyesno("确认", f"输出文件 '{os.path.basename(result_list_path)}' 已存在。\n\n是否覆盖该文件？")
-            if not choice:
-                return "操作已取消。"
-        
-        if self.generate_list_only.get():
-            with open(result_list_path, 'w', encoding='utf-8') as f:
-                if output_format == "text":
-                    f.write(f"# 文件排序 for 文件夹 {os.path.basename(folder)}\n")
-                    f.write(f"# 使用配置 相似度阈值 {self.similarity_threshold} (仅生成列表)\n")
-                    for idx, (orig_idx, item) in enumerate(matched, 1):
-                        f.write(f"{get_filename(item, folder)}\n")
-                    if missed:
-                        f.write(f"# 未匹配项目 (总共 {len(missed)} 个未匹配)\n")
-                        for orig_idx, item in missed:
-                            f.write(f"# {item}(第 {orig_idx} 行)\n")
-                    if unused:
-                        f.write(f"# 文件夹中未使用的项目 (总共 {len(unused)} 个项目)\n")
-                        for u in unused:
-                            item_type = "目录" if os.path.isdir(os.path.join(folder, u)) else "文件"
-                            f.write(f"# {get_filename(u, folder)} ({item_type})\n")
-                elif output_format == "json":
-                    data = {
-                        "folder": os.path.basename(folder),
-                        "threshold": self.similarity_threshold,
-                        "mode": "list_only",
-                        "matched": [get_filename(item, folder) for _, item in matched],
-                        "missed": [{"line": orig_idx, "item": item} for orig_idx, item in missed],
-                        "unused": [{"item": get_filename(u, folder), "type": "目录" if os.path.isdir(os.path.join(folder, u)) else "文件"} for u in unused]
-                    }
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                elif output_format == "m3u":
-                    f.write("#EXTM3U\n")
-                    for idx, (orig_idx, item) in enumerate(matched, 1):
-                        f.write(f"#EXTINF:-1,{item}\n")
-                        f.write(f"{get_filename(item, folder)}\n")
-            return f"列表生成完成！{os.path.basename(result_list_path)} 保存在 {result_dir}\n"
-        
-        # 确保输出目录存在
-        os.makedirs(result_dir, exist_ok=True)
-        
-        # 计算新名称
-        new_names = []
-        for idx, (orig_idx, item) in enumerate(matched, 1):
-            num = nums[idx-1]
-            new_name = self.generate_new_name(num, item)
-            new_names.append(new_name)
-        
-        # 复制或创建项目
-        for idx, (orig_idx, item) in enumerate(matched, 1):
-            new_name = new_names[idx-1]
-            src_path = os.path.join(folder, item)
-            dst_path = os.path.join(result_dir, new_name)
-            if os.path.isfile(src_path):
-                shutil.copy(src_path, dst_path)
-            elif os.path.isdir(src_path):
-                shutil.copytree(src_path, dst_path)
-        
-        # 生成Result.list
-        with open(result_list_path, 'w', encoding='utf-8') as f:
-            if output_format == "text":
-                f.write(f"# 文件排序 for 文件夹 {os.path.basename(folder)}\n")
-                f.write(f"# 使用配置 相似度阈值 {self.similarity_threshold}\n")
-                for new_name in new_names:
-                    item_type = "目录" if os.path.isdir(os.path.join(result_dir, new_name)) else "文件"
-                    f.write(f"{get_filename(new_name, result_dir)} ({item_type})\n")
-                if missed:
-                    f.write(f"# 未匹配项目 (总共 {len(missed)} 个未匹配)\n")
-                    for orig_idx, item in missed:
-                        f.write(f"# {item}(第 {orig_idx} 行)\n")
-                if unused:
-                    f.write(f"# 文件夹中未使用的项目 (总共 {len(unused)} 个项目)\n")
-                    for u in unused:
-                        item_type = "目录" if os.path.isdir(os.path.join(folder, u)) else "文件"
-                        f.write(f"# {get_filename(u, folder)} ({item_type})\n")
-            elif output_format == "json":
-                data = {
-                    "folder": os.path.basename(folder),
-                    "threshold": self.similarity_threshold,
-                    "mode": "full",
-                    "matched": [get_filename(new_name, result_dir) for new_name in new_names],
-                    "missed": [{"line": orig_idx, "item": item} for orig_idx, item in missed],
-                    "unused": [{"item": get_filename(u, folder), "type": "目录" if os.path.isdir(os.path.join(folder, u)) else "文件"} for u in unused]
-                }
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            elif output_format == "m3u":
-                f.write("#EXTM3U\n")
-                for idx, (orig_idx, item) in enumerate(matched, 1):
-                    new_name = new_names[idx-1]
-                    f.write(f"#EXTINF:-1,{item}\n")
-                    f.write(f"{get_filename(new_name, result_dir)}\n")
-        
-        return f"处理完成！结果保存在 {result_dir}\n"
-    
-    def select_candidate(self, item, candidates):
-        # 创建选择对话框
-        dialog = tk.Toplevel(self.root)
-        dialog.title(f"选择匹配文件 - {item}")
-        dialog.geometry("500x400")
-        dialog.configure(bg='#f0f0f0')
+                    choices[line_no] = idx
+                refresh(line_no)
+            show_candidates()
         
-        ttk.Label(dialog, text=f"为 '{item}' 选择匹配的文件:", font=('Microsoft YaHei', 12)).pack(pady=10)
-        
-        frame = ttk.Frame(dialog, style='Card.TFrame')
-        frame.pack(fill="both", expand=True, padx=10, pady=10)
-        
-        listbox = tk.Listbox(frame, height=15, font=('Microsoft YaHei', 10), selectbackground='#cce7ff')
-        for file, sim in candidates:
-            listbox.insert(tk.END, f"{file} (相似度: {sim:.2f})")
-        listbox.pack(fill="both", expand=True, padx=10, pady=10)
+        ttk.Button(bulk_frame, text="的行接受首选", command=accept_above).pack(side=tk.LEFT, padx=(0, 20))
+        ttk.Button(bulk_frame, text="全部接受首选", command=lambda: set_all(0)).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(bulk_frame, text="全部跳过", command=lambda: set_all(None)).pack(side=tk.LEFT)
         
         button_frame = ttk.Frame(dialog, style='Card.TFrame')
         button_frame.pack(fill="x", padx=10, pady=10)
+        ttk.Button(button_frame, text="完成", command=dialog.destroy, style='Accent.TButton').pack(side=tk.RIGHT, padx=20)
+        dialog.bind("<Return>", lambda event: dialog.destroy())
         
-        selected = [None]
-        
-        def on_select():
-            if listbox.curselection():
-                idx = listbox.curselection()[0]
-                selected[0] = candidates[idx][0]
-            dialog.destroy()
-        
-        def on_skip():
-            selected[0] = None
-            dialog.destroy()
-        
-        ttk.Button(button_frame, text="选择", command=on_select, style='Accent.TButton').pack(side=tk.LEFT, padx=20)
-        ttk.Button(button_frame, text="跳过", command=on_skip).pack(side=tk.RIGHT, padx=20)
+        first = str(requests[0][0])
+        tree.focus(first)
+        tree.selection_set(first)
+        tree.focus_set()
         
         dialog.wait_window()
-        return selected[0]
+        return {line_no: by_line[line_no][1][idx][0] for line_no, idx in choices.items()}
     
     def show_about(self):
         about_text = """
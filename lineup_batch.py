@@ -0,0 +1,165 @@
+"""批量模式：用同一个源文件夹为许多列表生成结果。
+
+源文件夹的项目表和打分索引只建立一次（每个工作进程一次），各个列表在多个进程中
+并行匹配，每个列表生成一个结果文件（例如 m3u），最后写出汇总报告。
+批量模式只生成列表，不复制文件；有多个候选的行在未开启自动选择时记为未匹配。
+"""
+import os
+import json
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+
+from lineup_core import (RESULT_FILES, ScoringTables, load_index, match_items, match_keys, resolve_workers,
+                         write_list_only)
+from lineup_lists import iter_list_file
+
+LIST_EXTENSIONS = (".txt", ".csv", ".tsv", ".xlsx")
+SUMMARY_FILE = "lineup-batch-summary.json"
+# 结果文件名 = 列表文件名 + RESULT_SUFFIX + 输出格式的扩展名，不会与列表文件重名
+RESULT_SUFFIX = ".Result"
+
+
+def find_list_files(source):
+    """source 是存放列表文件的目录，或每行一个列表文件路径的清单（相对路径相对于清单所在目录）。
+
+    目录中之前生成的结果文件（文件名以 RESULT_SUFFIX 结尾）不作为列表。
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if os.path.splitext(name)[1].lower() in LIST_EXTENSIONS and os.path.isfile(os.path.join(source, name))
+            and not os.path.splitext(name)[0].endswith(RESULT_SUFFIX)
+        )
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r', encoding='utf-8') as f:
+        return [os.path.join(base, line.strip()) for line in f if line.strip() and not line.startswith("#")]
+
+
+def output_names(list_files):
+    """每个列表的结果文件名（不含扩展名），同名的列表依次加上 -2、-3……"""
+    seen = Counter()
+    names = []
+    for path in list_files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] += 1
+        names.append((stem if seen[stem] == 1 else f"{stem}-{seen[stem]}") + RESULT_SUFFIX)
+    return names
+
+
+_batch_state = {}
+
+
+def _init_batch_worker(index, config, items, keys):
+    # 每个工作进程只接收一次项目表，并建立一次打分索引；
+    # keys 是参与匹配的名称（见 match_keys），结果再换回项目名
+    _batch_state["index"] = index
+    _batch_state["config"] = config
+    _batch_state["item_of"] = dict(zip(keys, items))
+    _batch_state["tables"] = ScoringTables(keys)
+
+
+def _run_list(job):
+    list_path, output_path = job
+    index = _batch_state["index"]
+    config = _batch_state["config"]
+    started = time.perf_counter()
+    try:
+        lines = list(iter_list_file(list_path))
+        matched, missed, unused = match_items(lines, None, config, tables=_batch_state["tables"])
+        item_of = _batch_state["item_of"]
+        matched = [(orig_idx, item_of[key]) for orig_idx, key in matched]
+        unused = [item_of[key] for key in unused]
+        # 输出目录通常不是源文件夹，列表中的相对路径相对于结果文件所在的目录
+        write_list_only(output_path, index, matched, missed, unused, config, list_dir=os.path.dirname(output_path))
+    except Exception as e:
+        # 一个列表出错（文件损坏、缺少可选依赖等）只记为该列表失败，不中断整个批量任务
+        return {"list": list_path, "error": str(e) or type(e).__name__}
+    return {
+        "list": list_path,
+        "output": output_path,
+        "lines": len(lines),
+        "matched": len(matched),
+        "missed": len(missed),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_batch(folder, source, config, progress=None):
+    """为 source 中的每个列表生成结果文件，返回汇总（同时写入输出目录的 SUMMARY_FILE）。
+
+    结果写到 config.output_folder（未设置时写到源文件夹），文件名取自列表文件名。
+    config.workers 是同时处理的列表数；每个列表内部串行打分。
+    progress(完成数, 总数) 在每个列表完成后调用。
+    """
+    started = time.perf_counter()
+    list_files = find_list_files(source)
+    output_dir = config.output_folder.strip() or folder
+    os.makedirs(output_dir, exist_ok=True)
+    ext = os.path.splitext(RESULT_FILES.get(config.output_format, "Result.txt"))[1]
+    jobs = [(path, os.path.join(output_dir, name + ext)) for path, name in zip(list_files, output_names(list_files))]
+    inputs = {os.path.normcase(os.path.abspath(path)) for path in list_files}
+    for path, output_path in jobs:
+        if os.path.normcase(os.path.abspath(output_path)) in inputs:
+            raise ValueError(f"结果文件会覆盖列表文件: {output_path}")
+
+    index = load_index(folder, config)
+    items = index.names(config.ignore_directories)
+    # 标签只在主进程中读取一次（按标签匹配时）
+    keys = match_keys(index, items, config)
+    index_seconds = time.perf_counter() - started
+    list_config = replace(config, workers=1)
+    workers = min(resolve_workers(config.workers), len(jobs))
+
+    results = []
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(index, list_config, items, keys)) as pool:
+            for result in pool.map(_run_list, jobs):
+                results.append(result)
+                if progress is not None:
+                    progress(len(results), len(jobs))
+    else:
+        _init_batch_worker(index, list_config, items, keys)
+        for job in jobs:
+            results.append(_run_list(job))
+            if progress is not None:
+                progress(len(results), len(jobs))
+
+    ok = [r for r in results if "error" not in r]
+    summary = {
+        "folder": os.path.abspath(folder),
+        "source": os.path.abspath(source),
+        "output_dir": os.path.abspath(output_dir),
+        "lists": len(results),
+        "failed": len(results) - len(ok),
+        "lines": sum(r["lines"] for r in ok),
+        "matched": sum(r["matched"] for r in ok),
+        "missed": sum(r["missed"] for r in ok),
+        "items": len(index.entries),
+        "index_seconds": round(index_seconds, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+        "results": results,
+    }
+    with open(os.path.join(output_dir, SUMMARY_FILE), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def format_batch_summary(summary):
+    parts = []
+    for r in summary["results"]:
+        name = os.path.basename(r["list"])
+        if "error" in r:
+            parts.append(f"  ✗ {name}: {r['error']}\n")
+        else:
+            parts.append(f"  {name}: {r['matched']}/{r['lines']} 行匹配，{r['missed']} 行未匹配 → "
+                         f"{os.path.basename(r['output'])}\n")
+    parts.append(
+        f"批量处理完成：{summary['lists']} 个列表（失败 {summary['failed']} 个），共 {summary['lines']} 行，"
+        f"匹配 {summary['matched']} 行；文件夹 {summary['items']} 个项目，读取用时 {summary['index_seconds']:.2f} 秒，"
+        f"总用时 {summary['seconds']:.2f} 秒\n"
+        f"结果保存在 {summary['output_dir']}，汇总报告: {SUMMARY_FILE}\n"
+    )
+    return "".join(parts)
@@ -0,0 +1,334 @@
+"""匹配引擎的性能基准测试。
+
+生成合成的音乐库（“艺术家-标题.扩展名”，中文和英文名称混合，含 Live 版本等
+相近的名称）和带噪声的播放列表（去掉扩展名、括号注释、feat.、Remix、错字、
+大小写和全角字符、库中没有的歌曲），然后分阶段计时：
+
+- listing    列出源文件夹（不使用索引缓存）
+- index      建立打分索引和完全匹配索引
+- scoring    完全匹配查表和模糊打分
+- assignment 全局分配
+- copy       复制匹配的文件
+- output     写出结果列表
+
+结果保存为 JSON，可以用 --compare 与之前版本的结果对比，某个阶段变慢超过
+--tolerance 倍时返回非零退出码。为了分开计时打分和分配，基准测试固定使用
+全局分配和自动选择。
+
+用法示例:
+    python lineup_bench.py --sizes 1000 10000 -o bench.json
+    python lineup_bench.py --data-dir /tmp/lineup-bench --compare bench-old.json -o bench-new.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from collections import Counter
+from dataclasses import asdict, replace
+
+from lineup_core import (LineupConfig, RESULT_FILES, ScoringTables, assign_global, clean_list_item, compute_numbers,
+                         copy_matched, generate_new_name, load_index, score_global, write_result_list)
+
+BENCH_VERSION = 1
+DEFAULT_SIZES = (1000, 10000, 100000)
+PHASES = ("listing", "index", "scoring", "assignment", "copy", "output")
+# 用时低于这个值的阶段不参与对比，避免计时误差造成误报
+MIN_COMPARE_SECONDS = 0.05
+
+CJK_CHARS = ("的一是不了人我在有他这中大来上个国到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可里后天小么"
+             "心多而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现分"
+             "将外但身些与高意进把法此实回二理美点月明其种声全工己话儿者向情部正名定女问力机给等几很业最间新什打便位因"
+             "晴雨星夜歌梦风花雪海云光春秋")
+LATIN_WORDS = ("love", "night", "blue", "dream", "fire", "heart", "rain", "summer", "moon", "star", "river", "dance",
+               "light", "shadow", "golden", "wild", "home", "city", "ocean", "forever", "young", "time", "road", "sky",
+               "ghost", "paper", "silver", "sweet", "broken", "echo", "midnight", "highway", "garden", "thunder")
+EXTENSIONS = (".mp3", ".flac", ".m4a")
+VERSION_TAGS = ("(Live)", "(Remix)", "(伴奏)", "(Acoustic)")
+LINE_TAGS = ("(Live)", "(Remix)", "(伴奏)", "【Live】", "（现场版）", "(feat. {})", "feat. {}", "- Remix")
+
+
+def _cjk_name(rng, low, high):
+    return "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(low, high)))
+
+
+def _latin_name(rng, low, high):
+    return " ".join(rng.choice(LATIN_WORDS).capitalize() for _ in range(rng.randint(low, high)))
+
+
+def _random_song(rng, cjk_ratio):
+    if rng.random() < cjk_ratio:
+        return _cjk_name(rng, 2, 3), _cjk_name(rng, 2, 6)
+    return _latin_name(rng, 1, 2), _latin_name(rng, 1, 4)
+
+
+def library_names(size, seed=0, cjk_ratio=0.5):
+    """size 个不重复的 “艺术家-标题.扩展名”，约一成是已有歌曲的 Live/Remix 等版本。"""
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < size:
+        if names and rng.random() < 0.1:
+            stem, ext = os.path.splitext(rng.choice(names))
+            name = f"{stem} {rng.choice(VERSION_TAGS)}{ext}"
+        else:
+            artist, title = _random_song(rng, cjk_ratio)
+            name = f"{artist}-{title}{rng.choice(EXTENSIONS)}"
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def _typo(rng, s):
+    if len(s) < 3:
+        return s
+    i = rng.randrange(len(s) - 1)
+    op = rng.randrange(3)
+    if op == 0:
+        return s[:i] + s[i + 1:]  # 漏字
+    if op == 1:
+        return s[:i] + s[i] + s[i:]  # 多字
+    return s[:i] + s[i + 1] + s[i] + s[i + 2:]  # 颠倒
+
+
+def _fullwidth(s):
+    return "".join(chr(ord(c) + 0xFEE0) if "!" <= c <= "~" else c for c in s)
+
+
+def noisy_line(rng, name, cjk_ratio=0.5):
+    """把库中的文件名变成播放列表中可能出现的写法。"""
+    stem = os.path.splitext(name)[0] if rng.random() < 0.6 else name
+    if rng.random() < 0.25:
+        tag = rng.choice(LINE_TAGS)
+        stem = f"{stem} {tag.format(_random_song(rng, cjk_ratio)[0])}"
+    if rng.random() < 0.15:
+        stem = _typo(rng, stem)
+    if rng.random() < 0.1:
+        stem = stem.lower() if rng.random() < 0.5 else stem.upper()
+    if rng.random() < 0.05:
+        stem = _fullwidth(stem)
+    return stem
+
+
+def make_playlist(names, count, seed=0, cjk_ratio=0.5, missing_ratio=0.05):
+    """返回 (列表行, 每行对应的库文件名)；库中没有的歌曲对应 None。"""
+    rng = random.Random(seed + 1)
+    picked = rng.sample(names, min(count, len(names)))
+    lines = []
+    truth = []
+    for name in picked:
+        if rng.random() < missing_ratio:
+            artist, title = _random_song(rng, cjk_ratio)
+            lines.append(f"{artist}-{title}")
+            truth.append(None)
+        else:
+            lines.append(noisy_line(rng, name, cjk_ratio))
+            truth.append(name)
+    return lines, truth
+
+
+def ensure_library(data_dir, size, seed=0, cjk_ratio=0.5, file_size=1024):
+    """在 data_dir 中生成（或沿用已生成的）库文件夹，返回 (文件夹, 文件名列表)。"""
+    folder = os.path.join(data_dir, f"library-{size}-{seed}")
+    manifest = folder + ".json"
+    params = {"size": size, "seed": seed, "cjk_ratio": cjk_ratio, "file_size": file_size}
+    if os.path.exists(manifest):
+        with open(manifest, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data["params"] == params:
+            return folder, data["names"]
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    names = library_names(size, seed, cjk_ratio)
+    block = random.Random(seed).randbytes(file_size)
+    for name in names:
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(block)
+    # 清单写在文件夹旁边，不会成为库中的项目
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump({"params": params, "names": names}, f, ensure_ascii=False)
+    return folder, names
+
+
+def run_size(data_dir, size, line_count, config, seed=0, cjk_ratio=0.5, file_size=1024):
+    """对一个规模的库运行一次完整的排序，返回这一规模的结果。"""
+    folder, names = ensure_library(data_dir, size, seed, cjk_ratio, file_size)
+    lines, truth = make_playlist(names, line_count, seed, cjk_ratio)
+    seconds = {}
+    stats = Counter()
+
+    started = time.perf_counter()
+    index = load_index(folder, replace(config, cache_index=False))
+    seconds["listing"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    items = index.names(config.ignore_directories)
+    tables = ScoringTables(items)
+    tables.exact(config.normalize, config.to_simplified)
+    if config.scorer == "numpy":
+        tables.vector
+    else:
+        tables.index
+    seconds["index"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    clean_lines = [clean_list_item(line) for line in lines]
+    scores = {}
+    choices, scored = score_global(lines, clean_lines, tables, config, stats, scores)
+    seconds["scoring"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    matched, missed, unused = assign_global(lines, tables, config, choices, scored, scores)
+    seconds["assignment"] = time.perf_counter() - started
+
+    result_dir = os.path.join(data_dir, f"result-{size}-{seed}")
+    if os.path.exists(result_dir):
+        shutil.rmtree(result_dir)
+    os.makedirs(result_dir)
+    nums = compute_numbers(config, len(matched))
+    new_names = [generate_new_name(config, num, item) for num, (orig_idx, item) in zip(nums, matched)]
+    started = time.perf_counter()
+    copy_stats = copy_matched(index, result_dir, matched, new_names, config.copy_workers, mode=config.link_mode)
+    seconds["copy"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    result_list_path = os.path.join(result_dir, RESULT_FILES.get(config.output_format, "Result.txt"))
+    write_result_list(result_list_path, index, result_dir, matched, missed, unused, new_names, config)
+    seconds["output"] = time.perf_counter() - started
+    shutil.rmtree(result_dir)
+
+    correct = sum(1 for orig_idx, item in matched if truth[orig_idx - 1] == item)
+    expected = sum(1 for name in truth if name is not None)
+    return {
+        "size": size,
+        "items": len(items),
+        "lines": len(lines),
+        "matched": len(matched),
+        "missed": len(missed),
+        "correct": correct,
+        "accuracy": round(correct / expected, 4) if expected else None,
+        "seconds": {phase: round(seconds[phase], 4) for phase in PHASES},
+        "total_seconds": round(sum(seconds.values()), 4),
+        "lines_per_sec": round(len(lines) / seconds["scoring"], 1) if seconds["scoring"] else None,
+        "items_listed_per_sec": round(len(items) / seconds["listing"], 1) if seconds["listing"] else None,
+        "copied_files": copy_stats.files,
+        "copied_bytes": copy_stats.bytes,
+        "match_stats": dict(stats),
+    }
+
+
+def run_benchmark(sizes, line_count, config, data_dir, seed=0, cjk_ratio=0.5, file_size=1024, progress=None):
+    """依次运行每个规模，返回可以写成 JSON 的结果。progress(结果) 在每个规模完成后调用。"""
+    results = []
+    for size in sizes:
+        result = run_size(data_dir, size, line_count, config, seed, cjk_ratio, file_size)
+        results.append(result)
+        if progress is not None:
+            progress(result)
+    return {
+        "version": BENCH_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "cjk_ratio": cjk_ratio,
+        "file_size": file_size,
+        "config": asdict(config),
+        "results": results,
+    }
+
+
+def compare_results(old, new, tolerance):
+    """对比两次结果中相同规模的各阶段用时，返回 [(规模, 阶段, 旧用时, 新用时)] 中变慢超过 tolerance 倍的项。"""
+    old_by_size = {r["size"]: r for r in old["results"]}
+    regressions = []
+    for result in new["results"]:
+        before = old_by_size.get(result["size"])
+        if before is None:
+            continue
+        for phase in PHASES:
+            old_seconds = before["seconds"].get(phase)
+            new_seconds = result["seconds"][phase]
+            if old_seconds is None or max(old_seconds, new_seconds) < MIN_COMPARE_SECONDS:
+                continue
+            if new_seconds > old_seconds * tolerance:
+                regressions.append((result["size"], phase, old_seconds, new_seconds))
+    return regressions
+
+
+def format_result(result):
+    parts = [f"{result['size']} 个项目，{result['lines']} 行：匹配 {result['matched']} 行"
+             f"（正确 {result['correct']}，准确率 {result['accuracy']}），未匹配 {result['missed']} 行\n"]
+    for phase in PHASES:
+        parts.append(f"  {phase:<11}{result['seconds'][phase]:>10.3f} 秒\n")
+    parts.append(f"  {'total':<11}{result['total_seconds']:>10.3f} 秒，打分 {result['lines_per_sec']} 行/秒\n")
+    return "".join(parts)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="lineup-bench", description="用合成的音乐库测试排序各阶段的速度")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="库的项目数")
+    parser.add_argument("--lines", type=int, default=1000, help="播放列表的行数（不超过库的项目数）")
+    parser.add_argument("--cjk-ratio", type=float, default=0.5, help="中文名称所占的比例")
+    parser.add_argument("--file-size", type=int, default=1024, help="每个合成文件的字节数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同的种子生成相同的库和列表")
+    parser.add_argument("--data-dir", help="存放合成库的目录，指定时保留下来供之后的运行沿用（默认用临时目录）")
+    parser.add_argument("-t", "--threshold", type=float, default=0.6, help="相似度阈值")
+    parser.add_argument("--scorer", choices=["difflib", "numpy"], default="difflib", help="打分方式")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="打分使用的进程数，0 表示全部 CPU 核心")
+    parser.add_argument("--copy-workers", type=int, default=4, help="同时复制的文件数")
+    parser.add_argument("--link-mode", choices=["copy", "hardlink", "symlink", "reflink"], default="copy",
+                        help="生成结果的方式")
+    parser.add_argument("-f", "--format", choices=["text", "json", "m3u"], default="json", help="结果列表的格式")
+    parser.add_argument("-o", "--output", default="lineup-bench.json", help="结果 JSON 的路径")
+    parser.add_argument("--compare", metavar="PATH", help="与之前保存的结果对比")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="对比时允许的变慢倍数")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = LineupConfig(
+        similarity_threshold=args.threshold,
+        auto_select_highest=True,
+        assignment="global",
+        scorer=args.scorer,
+        workers=args.workers,
+        copy_workers=args.copy_workers,
+        link_mode=args.link_mode,
+        output_format=args.format,
+        cache_index=False,
+    )
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="lineup-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        report = run_benchmark(args.sizes, args.lines, config, data_dir, args.seed, args.cjk_ratio, args.file_size,
+                               progress=lambda result: print(format_result(result), end="", flush=True))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果保存在 {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        regressions = compare_results(old, report, args.tolerance)
+        for size, phase, before, after in regressions:
+            print(f"变慢: {size} 个项目的 {phase} 从 {before:.3f} 秒变为 {after:.3f} 秒", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"与 {args.compare} 相比没有超过 {args.tolerance} 倍的变慢")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""共享的音乐标签目录（SQLite）。
+
+一次并行扫描读取音乐文件的标签，记录路径、大小、修改时间、标题、艺术家、时长、
+是否有歌词，以及按文件名解析出的艺术家和标题。大小和修改时间没有变化的文件
+不再解析。目录保存在音乐文件夹旁边的 .<文件夹名>.lineup-catalog.sqlite 中，
+lineup（按标签匹配）、check.py 和 clean_metadata.py 共用同一份，哪个工具先扫描，
+其他工具就直接使用它的结果。读取标签需要安装 mutagen。
+
+SQLite 只在创建目录的线程中访问；工作线程只读取内存中的记录，新的记录由
+调用方线程写入，commit() 时一次写进数据库。
+"""
+import os
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, astuple
+
+CATALOG_VERSION = 2
+AUDIO_EXTENSIONS = ('.flac', '.mp3')
+SCAN_WORKERS = 8
+
+
+def parse_filename(filename):
+    """Parse filename to extract artist and title.
+    If '&' exists, split on the first '-' after the last '&'.
+    If no '&', split on the first '-'.
+    """
+    name = os.path.splitext(filename)[0]
+    if '&' in name:
+        # Find last '&'
+        last_amp = name.rfind('&')
+        # Part after last '&'
+        after_amp = name[last_amp + 1:]
+        if '-' in after_amp:
+            # Find first '-' in after_amp
+            first_dash = after_amp.find('-')
+            # Artist: everything before last_amp + '&' + after_amp[:first_dash]
+            artist = name[:last_amp + 1] + after_amp[:first_dash]
+            title = after_amp[first_dash + 1:]
+        else:
+            # No '-' after last '&', treat as invalid
+            artist = ''
+            title = name
+    else:
+        # No '&', split on first '-'
+        if '-' in name:
+            first_dash = name.find('-')
+            artist = name[:first_dash]
+            title = name[first_dash + 1:]
+        else:
+            artist = ''
+            title = name
+    return artist.strip(), title.strip()
+
+
+def catalog_path(folder):
+    """目录放在文件夹旁边（父目录中），不改变文件夹本身的修改时间。文件系统的根目录返回 None。"""
+    parent, name = os.path.split(os.path.abspath(folder).rstrip(os.sep))
+    if not name:
+        return None
+    return os.path.join(parent, f".{name}.lineup-catalog.sqlite")
+
+
+def iter_audio_files(folder, recursive=False):
+    """逐个返回音乐文件相对于 folder 的路径。"""
+    if not recursive:
+        for fname in os.listdir(folder):
+            if fname.lower().endswith(AUDIO_EXTENSIONS):
+                yield fname
+        return
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.lower().endswith(AUDIO_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, fname), folder)
+
+
+@dataclass
+class CatalogEntry:
+    path: str  # 相对于目录根文件夹的路径
+    size: int
+    mtime_ns: int
+    ok: bool  # 标签读取成功
+    title: str = ""
+    artist: str = ""
+    duration: float = 0.0
+    has_lyrics: bool = False
+    extra_tags: int = 0  # 标题和艺术家之外的标签数，多值的标题或艺术家多出的值和 mp3 的 ID3v1 标签也计入
+    file_artist: str = ""  # parse_filename 的结果
+    file_title: str = ""
+
+    @property
+    def is_clean(self):
+        """标签是否正好是 clean_metadata 会写入的内容（只有按文件名解析的标题和艺术家）。"""
+        return (self.ok and self.extra_tags == 0 and bool(self.title)
+                and self.title == self.file_title and self.artist == self.file_artist)
+
+    @property
+    def tag_key(self):
+        """按标签匹配时使用的名称：“艺术家-标题”，没有艺术家时只用标题；没有标题时返回 None。"""
+        if not self.ok or not self.title:
+            return None
+        return f"{self.artist}-{self.title}" if self.artist else self.title
+
+
+def has_id3v1(filepath):
+    """文件末尾是否有 ID3v1 标签。mutagen 会把它合并进 ID3 标签中，单看标签分辨不出来。"""
+    with open(filepath, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < 128:
+            return False
+        f.seek(-128, os.SEEK_END)
+        return f.read(3) == b'TAG'
+
+
+def _mutagen_file():
+    try:
+        from mutagen import File
+    except ImportError:
+        raise RuntimeError("读取音乐标签需要安装 mutagen：pip install mutagen")
+    return File
+
+
+def _read_tags(audio):
+    """返回 (标题值列表, 艺术家值列表, 是否有歌词, 其他标签数)。"""
+    tags = audio.tags
+    if tags is None:
+        return [], [], False, 0
+    if hasattr(tags, "getall"):  # ID3
+        titles = [str(text) for frame in tags.getall("TIT2") for text in frame.text]
+        artists = [str(text) for frame in tags.getall("TPE1") for text in frame.text]
+        lyrics = any(frame.text.strip() for frame in tags.getall("USLT"))
+        others = {key for key in tags.keys() if key not in ("TIT2", "TPE1")}
+    else:  # Vorbis 注释（flac），键不区分大小写
+        titles = list(tags.get("title", []))
+        artists = list(tags.get("artist", []))
+        lyrics = any(text.strip() for text in tags.get("lyrics", []))
+        others = {key.lower() for key in tags.keys()} - {"title", "artist"}
+    return titles, artists, lyrics, len(others) + max(0, len(titles) - 1) + max(0, len(artists) - 1)
+
+
+def read_entry(root, rel, st):
+    """读取一个文件的标签，st 是它的 os.stat 结果。读取失败时返回 ok 为 False 的记录。"""
+    file_artist, file_title = parse_filename(os.path.basename(rel))
+    entry = CatalogEntry(rel, st.st_size, st.st_mtime_ns, False, file_artist=file_artist, file_title=file_title)
+    open_audio = _mutagen_file()
+    try:
+        audio = open_audio(os.path.join(root, rel))
+    except Exception:
+        return entry
+    if audio is None:
+        return entry
+    titles, artists, lyrics, extra = _read_tags(audio)
+    entry.ok = True
+    entry.title = titles[0] if titles else ""
+    entry.artist = artists[0] if artists else ""
+    entry.duration = float(getattr(audio.info, "length", 0.0) or 0.0)
+    entry.has_lyrics = lyrics
+    # ID3v1 标签也算作其他标签，clean_metadata 改写时会删除它
+    entry.extra_tags = extra + (rel.lower().endswith('.mp3') and has_id3v1(os.path.join(root, rel)))
+    return entry
+
+
+class AudioCatalog:
+    """一个根文件夹的标签目录。path 默认是 catalog_path(root)，":memory:" 表示不保存。
+
+    目录文件无法打开或写入（例如父目录只读）时只使用内存中的记录，与没有目录时相同。
+    """
+
+    def __init__(self, root, path=None):
+        self.root = root
+        path = path or catalog_path(root) or ":memory:"
+        try:
+            self.conn, self.entries = self._open(path)
+        except sqlite3.Error:
+            self.conn, self.entries = self._open(":memory:")
+        self.changed = {}
+        self.parsed = 0
+        self.cached = 0
+
+    @staticmethod
+    def _open(path):
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+                conn.execute("DROP TABLE IF EXISTS files")
+                conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, ok INTEGER, "
+                "title TEXT, artist TEXT, duration REAL, has_lyrics INTEGER, extra_tags INTEGER, "
+                "file_artist TEXT, file_title TEXT)")
+            entries = {}
+            for row in conn.execute("SELECT * FROM files"):
+                entry = CatalogEntry(*row)
+                entry.ok = bool(entry.ok)
+                entry.has_lyrics = bool(entry.has_lyrics)
+                entries[entry.path] = entry
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn, entries
+
+    def _write(self, sql, rows):
+        try:
+            self.conn.executemany(sql, rows)
+            self.conn.commit()
+        except sqlite3.Error:
+            # 目录文件只读：记录仍保留在内存中，本次运行照常使用
+            self.conn.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, rel):
+        return self.entries.get(rel)
+
+    def current(self, rel):
+        """返回 (记录, 是否新读取)；文件没有变化时直接使用已有的记录。可以在工作线程中调用。
+
+        文件已不存在时返回 (None, False)。新读取的记录要由调用方线程用 put() 保存。
+        """
+        try:
+            st = os.stat(os.path.join(self.root, rel))
+        except OSError:
+            return None, False
+        entry = self.entries.get(rel)
+        if entry is not None and entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+            return entry, False
+        return read_entry(self.root, rel, st), True
+
+    def put(self, entry):
+        self.entries[entry.path] = self.changed[entry.path] = entry
+
+    def refresh(self, rel):
+        """文件被修改（例如重设标题）后重新读取它的标签。"""
+        entry, fresh = self.current(rel)
+        if fresh:
+            self.put(entry)
+        return entry
+
+    def mark_rewritten(self, rel):
+        """clean_metadata 把标签改写为按文件名解析的标题和艺术家之后更新记录，不再重新解析。"""
+        st = os.stat(os.path.join(self.root, rel))
+        old = self.entries.get(rel)
+        artist, title = parse_filename(os.path.basename(rel))
+        self.put(CatalogEntry(rel, st.st_size, st.st_mtime_ns, True, title, artist,
+                              old.duration if old is not None else 0.0, False, 0, artist, title))
+
+    def update(self, paths, workers=SCAN_WORKERS, on_entry=None):
+        """确保 paths（相对路径）中每个文件的记录都是最新的，返回仍然存在的路径集合。
+
+        各个文件在有上限的线程池中检查，只有大小或修改时间变化了的才解析标签。
+        on_entry(记录) 按完成的顺序在调用方线程中调用，可以用来边扫描边显示结果。
+        """
+        seen = set()
+
+        def record(result):
+            entry, fresh = result
+            if entry is None:
+                return
+            seen.add(entry.path)
+            if fresh:
+                self.parsed += 1
+                self.put(entry)
+            else:
+                self.cached += 1
+            if on_entry is not None:
+                on_entry(entry)
+
+        if workers <= 1:
+            for rel in paths:
+                record(self.current(rel))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending = set()
+                for rel in paths:
+                    pending.add(pool.submit(self.current, rel))
+                    if len(pending) >= workers * 4:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record(future.result())
+                for future in pending:
+                    record(future.result())
+        self.commit()
+        return seen
+
+    def scan(self, recursive=True, workers=SCAN_WORKERS, on_entry=None):
+        """遍历根文件夹并更新所有音乐文件的记录，删除扫描范围内已经不存在的文件的记录。"""
+        seen = self.update(iter_audio_files(self.root, recursive), workers, on_entry)
+        gone = [rel for rel in self.entries if rel not in seen and (recursive or os.sep not in rel)]
+        for rel in gone:
+            del self.entries[rel]
+            self.changed.pop(rel, None)
+        self._write("DELETE FROM files WHERE path = ?", [(rel,) for rel in gone])
+
+    def commit(self):
+        self._write("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [astuple(entry) for entry in self.changed.values()])
+        self.changed.clear()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+def tag_keys(index, items, workers=SCAN_WORKERS, names=None):
+    """按标签匹配时每个项目的匹配名称，与 items 一一对应且互不相同。
+
+    音乐文件使用标签中的“艺术家-标题”（见 CatalogEntry.tag_key），标签先在各源文件夹的
+    目录中更新（只解析有变化的文件）；其他项目、没有标题的文件和重复的名称仍用 names
+    中对应的名称（默认是项目名）。
+    """
+    by_root = defaultdict(list)
+    for item in items:
+        if item.lower().endswith(AUDIO_EXTENSIONS) and not index.is_dir(item):
+            by_root[index.root(item)].append(item)
+    entries = {}
+    for root, paths in by_root.items():
+        with AudioCatalog(root) as catalog:
+            catalog.update(paths, workers)
+            entries.update((rel, catalog.get(rel)) for rel in paths)
+
+    keys = []
+    used = set()
+    for item, name in zip(items, names if names is not None else items):
+        entry = entries.get(item)
+        key = entry.tag_key if entry is not None else None
+        if key is None or key in used:
+            key = name if name not in used else item
+        base, n = key, 2
+        while key in used:
+            key = f"{base} ({n})"
+            n += 1
+        used.add(key)
+        keys.append(key)
+    return keys
@@ -0,0 +1,245 @@
+"""文件排序器命令行入口，不需要图形界面。
+
+用法示例:
+    python lineup_cli.py Folder testList.txt --auto-select --format m3u --list-only
+    python lineup_cli.py Folder Playlists/ --batch --auto-select --format m3u -o Folder/Playlists -j 0
+"""
+import os
+import sys
+import argparse
+
+from lineup_core import (LineupConfig, MatchPlan, prepare_plan, apply_plan, load_index, format_preview,
+                         format_match_stats)
+from lineup_index import SCAN_WORKERS
+from lineup_batch import run_batch, format_batch_summary
+from lineup_lists import iter_list_file
+from lineup_metrics import RunMetrics, profiled
+from lineup_rename import undo_renames
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="lineup", description="按照列表顺序排列文件夹中的文件和目录")
+    parser.add_argument("folder", nargs="?", help="源文件夹")
+    parser.add_argument("list", nargs="?", help="目的列表文件（.txt 每行一项，.xlsx/.csv/.tsv 读取第一列，- 表示标准输入）")
+    parser.add_argument("-t", "--threshold", type=float, default=0.6, help="相似度阈值 (默认 0.6)")
+    parser.add_argument("-a", "--auto-select", action="store_true", help="自动选择最高相似度")
+    parser.add_argument("-l", "--list-only", action="store_true", help="仅生成列表，不复制文件")
+    parser.add_argument("--link-mode", choices=["copy", "hardlink", "symlink", "reflink"], default="copy",
+                        help="生成 Result 的方式：复制、硬链接、符号链接或 reflink 克隆（链接失败时复制）")
+    parser.add_argument("--in-place", action="store_true",
+                        help="在源文件夹中直接重命名匹配的项目，不复制（会写入撤销记录）")
+    parser.add_argument("--undo", metavar="JOURNAL", help="按撤销记录恢复原地重命名之前的名称")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归扫描子文件夹中的文件（项目名为相对路径）")
+    parser.add_argument("--extra-root", action="append", default=[], metavar="FOLDER",
+                        help="其他源文件夹，可重复；同一相对路径以先列出的文件夹为准")
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS, help="并行列出目录的线程数")
+    parser.add_argument("--ignore-dirs", action="store_true", help="忽略目录（只处理文件）")
+    parser.add_argument("-f", "--format", choices=["text", "json", "m3u"], default="text", help="输出格式")
+    parser.add_argument("--absolute", action="store_true", help="输出中使用绝对路径")
+    parser.add_argument("-o", "--output", default="", help="输出文件夹")
+    parser.add_argument("--rename-mode", choices=["add_prefix", "custom_format"], default="add_prefix", help="重命名模式")
+    parser.add_argument("--separator", default="-", help="前缀分隔符")
+    parser.add_argument("--name-format", default="[Num]", help="自定义格式 (使用[Num])")
+    parser.add_argument("--start", type=int, default=1, help="起始序号")
+    parser.add_argument("--step", type=int, default=1, help="跨度")
+    parser.add_argument("--reverse", action="store_true", help="倒序")
+    parser.add_argument("--end", type=int, default=1, help="倒序时的起始序号")
+    parser.add_argument("--scorer", choices=["difflib", "numpy"], default="difflib",
+                        help="打分方式：difflib 精确匹配，numpy 向量化批量打分 (需要安装 numpy)")
+    parser.add_argument("--top-k", type=int, default=10, help="numpy 打分或全局分配时每行保留的候选数")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="打分使用的进程数，0 表示全部 CPU 核心")
+    parser.add_argument("--assignment", choices=["sequential", "global"], default="sequential",
+                        help="分配方式：sequential 按列表顺序，global 先给所有行打分再全局分配")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="完全匹配只比较原名，不做全半角、大小写、括号和扩展名的规范化")
+    parser.add_argument("--simplified", action="store_true", help="规范化时把繁体转为简体（需要安装 opencc）")
+    parser.add_argument("--match-tags", action="store_true",
+                        help="音乐文件按标签中的“艺术家-标题”匹配，标签记录在共享的标签目录中（需要安装 mutagen）")
+    parser.add_argument("--copy-workers", type=int, default=4, help="同时复制的文件数")
+    parser.add_argument("--no-index-cache", action="store_true", help="不读取也不写入文件夹旁边的索引缓存")
+    parser.add_argument("--batch", action="store_true",
+                        help="批量模式：list 是存放列表文件的目录或清单文件，为每个列表生成一个结果文件；-j 为同时处理的列表数")
+    parser.add_argument("-p", "--preview", action="store_true", help="只预览，不写入任何文件")
+    parser.add_argument("--save-plan", metavar="PATH", help="把匹配计划保存为 JSON，可与 --preview 一起使用")
+    parser.add_argument("--apply-plan", metavar="PATH", help="执行之前保存的匹配计划，不再重新匹配")
+    parser.add_argument("--stats", action="store_true", help="在标准错误输出匹配统计")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="用 cProfile 记录这次运行并保存为 pstats 文件（也可以设置环境变量 LINEUP_PROFILE）")
+    parser.add_argument("-y", "--yes", action="store_true", help="覆盖已存在的输出而不询问")
+    return parser
+
+
+def config_from_args(args):
+    return LineupConfig(
+        similarity_threshold=args.threshold,
+        auto_select_highest=args.auto_select,
+        generate_list_only=args.list_only,
+        ignore_directories=args.ignore_dirs,
+        output_format=args.format,
+        filename_format="absolute" if args.absolute else "relative",
+        output_folder=args.output,
+        rename_mode=args.rename_mode,
+        separator=args.separator,
+        format_str=args.name_format,
+        start_num=args.start,
+        step=args.step,
+        reverse=args.reverse,
+        end_num=args.end,
+        scorer=args.scorer,
+        top_k=args.top_k,
+        workers=args.workers,
+        assignment=args.assignment,
+        copy_workers=args.copy_workers,
+        link_mode=args.link_mode,
+        cache_index=not args.no_index_cache,
+        in_place=args.in_place,
+        recursive=args.recursive,
+        extra_folders=args.extra_root,
+        scan_workers=args.scan_workers,
+        normalize=not args.no_normalize,
+        to_simplified=args.simplified,
+        match_tags=args.match_tags,
+    )
+
+
+def _prompt(message):
+    try:
+        return input(message)
+    except EOFError:
+        return None
+
+
+def _interactive():
+    return sys.stdin.isatty()
+
+
+def select_candidate(item, candidates):
+    if not _interactive():
+        return None
+    print(f"为 '{item}' 选择匹配的文件:")
+    for n, (file, sim) in enumerate(candidates, 1):
+        print(f"  {n}. {file} (相似度: {sim:.2f})")
+    answer = _prompt("输入序号，直接回车跳过: ")
+    if answer and answer.strip().isdigit() and 1 <= int(answer) <= len(candidates):
+        return candidates[int(answer) - 1][0]
+    return None
+
+
+def review_candidates(requests):
+    """所有行打分完成后，依次询问有多个候选的行。"""
+    if not _interactive():
+        return {}
+    print(f"共有 {len(requests)} 行有多个候选，需要选择:")
+    picked = {}
+    for line_no, item, candidates in requests:
+        print(f"第 {line_no} 行", end=" ")
+        choice = select_candidate(item, candidates)
+        if choice is not None:
+            picked[line_no] = choice
+    return picked
+
+
+def make_confirm(assume_yes):
+    def confirm(message):
+        if assume_yes:
+            return True
+        if not _interactive():
+            return False
+        answer = _prompt(f"{message} (y/n): ")
+        return bool(answer) and answer.strip().lower() == 'y'
+    return confirm
+
+
+def ask_string(title, prompt):
+    if not _interactive():
+        return None
+    return _prompt(prompt)
+
+
+def print_copy_progress(stats):
+    if sys.stderr.isatty():
+        print(f"\r{stats.summary()}", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    with profiled(args.profile):
+        return run(parser, args)
+
+
+def run(parser, args):
+    confirm = make_confirm(args.yes)
+
+    if args.undo:
+        try:
+            count = undo_renames(args.undo)
+        except (OSError, ValueError) as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return 1
+        print(f"已恢复 {count} 个项目的原名称")
+        return 0
+
+    if args.apply_plan:
+        # 执行之前保存的计划：匹配结果和设置都来自计划文件
+        plan = MatchPlan.load(args.apply_plan)
+        if not os.path.isdir(plan.folder):
+            print(f"错误: {plan.folder} 不是一个目录", file=sys.stderr)
+            return 1
+        metrics = RunMetrics()
+        with metrics.phase("listing"):
+            index = load_index(plan.folder, plan.config)
+        metrics.plan_reused = True
+        metrics.matched = len(plan.matched)
+        try:
+            result = apply_plan(plan, plan.config, index, confirm=confirm, ask_string=ask_string,
+                                progress=print_copy_progress, metrics=metrics)
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return 1
+        print(result, end="")
+        return 0
+
+    if args.folder is None or args.list is None:
+        parser.error("需要提供源文件夹和目的列表（或使用 --apply-plan / --undo）")
+    folder = args.folder
+    for path in [folder] + args.extra_root:
+        if not os.path.isdir(path):
+            print(f"错误: {path} 不是一个目录", file=sys.stderr)
+            return 1
+
+    config = config_from_args(args)
+    if args.batch:
+        try:
+            summary = run_batch(folder, args.list, config)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return 1
+        print(format_batch_summary(summary), end="")
+        return 1 if summary["failed"] else 0
+
+    # 列表逐行读取后直接交给引擎，不在这里另存一份
+    metrics = RunMetrics()
+    index, plan = prepare_plan(folder, iter_list_file(args.list), config, review=review_candidates, metrics=metrics)
+    if not plan.lines:
+        print("错误: 请提供目的列表", file=sys.stderr)
+        return 1
+    if args.save_plan:
+        plan.save(args.save_plan)
+    if args.preview:
+        result = format_preview(index, plan.matched, plan.missed, plan.unused, plan.new_names) + metrics.summary()
+    else:
+        try:
+            result = apply_plan(plan, config, index, confirm=confirm, ask_string=ask_string,
+                                progress=print_copy_progress, metrics=metrics)
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return 1
+    print(result, end="")
+    if args.stats:
+        print(format_match_stats(metrics.stats), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""结果文件夹的复制引擎。
+
+用有上限的线程池同时复制多个文件，目录也会展开成单个文件并行复制。
+单个文件优先使用 os.copy_file_range / os.sendfile 在内核中复制，数据不经过
+Python；都不可用时退回 shutil.copyfile。复制过程中通过回调报告速度。
+
+除了复制，也可以用硬链接、符号链接或 reflink（写时复制的克隆）生成结果，
+链接失败（例如跨设备）时退回复制。
+"""
+import os
+import sys
+import time
+import errno
+import shutil
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+COPY_CHUNK = 64 * 1024 * 1024
+# Linux 的 FICLONE ioctl，btrfs / XFS 等文件系统支持
+FICLONE = 0x40049409
+
+LINK_MODES = ("copy", "hardlink", "symlink", "reflink")
+
+# 这些错误表示当前文件系统不支持该系统调用，可以换一种方式复制
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.EPERM}
+
+
+class CopyStats:
+    """复制进度，可以在多个线程中更新。"""
+
+    def __init__(self, total_bytes=0):
+        self.files = 0
+        self.bytes = 0
+        self.linked = 0
+        self.total_bytes = total_bytes  # 预计要处理的总字节数，展开目录时会增加
+        self.processed = 0  # 已处理的字节数，包括链接的文件
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, size, linked=False):
+        """记录一个完成的文件；链接的文件不计入复制的字节数。"""
+        with self._lock:
+            self.files += 1
+            self.processed += size
+            if linked:
+                self.linked += 1
+            else:
+                self.bytes += size
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def files_per_sec(self):
+        return self.files / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_sec(self):
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """按目前的速度估计剩余秒数，还无法估计时返回 None。"""
+        if not self.total_bytes or not self.processed:
+            return None
+        return max(0.0, self.elapsed * (self.total_bytes - self.processed) / self.processed)
+
+    def summary(self):
+        text = (f"已复制 {self.files} 个文件，{format_size(self.bytes)}，"
+                f"{format_size(self.bytes_per_sec)}/s，{self.files_per_sec:.1f} 个文件/s")
+        if self.linked:
+            text += f"（其中 {self.linked} 个为链接）"
+        return text
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def _copy_file_range(fsrc, fdst):
+    copied = 0
+    while True:
+        n = os.copy_file_range(fsrc, fdst, COPY_CHUNK)
+        if n == 0:
+            return copied
+        copied += n
+
+
+def _sendfile(fsrc, fdst):
+    copied = 0
+    while True:
+        n = os.sendfile(fdst, fsrc, copied, COPY_CHUNK)
+        if n == 0:
+            return copied
+        copied += n
+
+
+def _kernel_copy(src, dst):
+    """尝试在内核中复制，返回复制的字节数。
+
+    不支持时返回 None 且不留下部分内容；复制的字节数与源文件大小不符（例如
+    copy_file_range 在某些文件系统上直接返回 0）时也返回 None，由调用方重新复制。
+    """
+    methods = []
+    if hasattr(os, "copy_file_range"):
+        methods.append(_copy_file_range)
+    if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        methods.append(_sendfile)
+    if not methods:
+        return None
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        for method in methods:
+            try:
+                copied = method(fsrc.fileno(), fdst.fileno())
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED or fdst.tell() != 0:
+                    raise
+                continue
+            return copied if copied == os.fstat(fsrc.fileno()).st_size else None
+    return None
+
+
+def copy_file(src, dst):
+    """复制文件内容和权限位（与 shutil.copy 相同），返回文件大小。"""
+    if os.path.islink(dst) or os.path.isfile(dst):
+        # 上次以硬链接或符号链接方式生成的结果与源文件共用数据，直接写入会覆盖源文件
+        os.remove(dst)
+    size = _kernel_copy(src, dst)
+    if size is None:
+        shutil.copyfile(src, dst)
+        size = os.path.getsize(dst)
+    shutil.copymode(src, dst)
+    return size
+
+
+def _reflink(src, dst):
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflink 不可用")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copymode(src, dst)
+
+
+def transfer_file(src, dst, mode="copy"):
+    """按 mode 生成 dst，链接失败时退回复制。返回 (文件大小, 是否为链接)。"""
+    if mode != "copy":
+        if os.path.lexists(dst) and not os.path.isdir(dst):
+            os.remove(dst)  # 与复制一样覆盖已存在的结果
+        try:
+            if mode == "hardlink":
+                os.link(src, dst)
+            elif mode == "symlink":
+                os.symlink(os.path.abspath(src), dst)
+            elif mode == "reflink":
+                _reflink(src, dst)
+            return os.path.getsize(src), True
+        except OSError:
+            # 跨设备、文件系统不支持或没有权限，删除可能留下的空文件后复制
+            if mode == "reflink" and os.path.exists(dst):
+                os.remove(dst)
+    return copy_file(src, dst), False
+
+
+def _expand_tree(src, dst, dirs):
+    """创建目标目录结构（与 shutil.copytree 一样要求目标不存在），返回其中所有文件的 (源, 目标)。"""
+    os.makedirs(dst)
+    files = []
+    for root, dirnames, filenames in os.walk(src, followlinks=True):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        dirs.append((root, target))
+        for name in dirnames:
+            os.makedirs(os.path.join(target, name), exist_ok=True)
+        for name in filenames:
+            files.append((os.path.join(root, name), os.path.join(target, name)))
+    return files
+
+
+def _symlink_dir(src, dst):
+    try:
+        os.symlink(os.path.abspath(src), dst, target_is_directory=True)
+        return True
+    except OSError:
+        return False
+
+
+def copy_items(jobs, workers=4, progress=None, stats=None, mode="copy"):
+    """并行复制 jobs 中的 (源, 目标, 是否目录)。
+
+    mode 为 LINK_MODES 之一。符号链接模式下目录本身被链接；硬链接和 reflink
+    只能用于文件，目录会展开后逐个文件链接。
+    progress(stats) 在每个文件复制完成后调用（在调用线程中）；它抛出异常时不再开始新的
+    文件，正在复制的文件完成后异常继续向上传递，可用于取消。返回 CopyStats。
+    """
+    if stats is None:
+        stats = CopyStats()
+    dirs = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = []
+        try:
+            for src, dst, is_dir in jobs:
+                if is_dir and mode == "symlink" and _symlink_dir(src, dst):
+                    stats.add(0, linked=True)
+                elif is_dir:
+                    for fsrc, fdst in _expand_tree(src, dst, dirs):
+                        stats.total_bytes += os.path.getsize(fsrc)
+                        futures.append(pool.submit(transfer_file, fsrc, fdst, mode))
+                else:
+                    futures.append(pool.submit(transfer_file, src, dst, mode))
+            for future in as_completed(futures):
+                stats.add(*future.result())
+                if progress is not None:
+                    progress(stats)
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+    # 文件复制完再设置目录的时间戳和权限，与 shutil.copytree 一致
+    for src, dst in reversed(dirs):
+        shutil.copystat(src, dst)
+    return stats
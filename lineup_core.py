@@ -0,0 +1,1066 @@
+"""文件排序器的匹配引擎。
+
+不依赖 tkinter / openpyxl，可以在没有图形界面的环境（cron、服务器）中直接导入使用。
+图形界面 (lineup.py) 和命令行 (lineup_cli.py) 共用这里的逻辑。
+"""
+import os
+import re
+import difflib
+import json
+import math
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field, fields, replace
+from contextlib import nullcontext
+from functools import cached_property
+
+from lineup_copy import CopyStats, copy_items
+from lineup_index import FolderIndex, LibraryIndex, SCAN_WORKERS
+from lineup_rename import rename_in_place
+from lineup_normalize import ExactIndex, strip_brackets
+from lineup_metrics import RunMetrics, profiled
+from lineup_catalog import tag_keys
+
+RESULT_FILES = {
+    "text": "Result.txt",
+    "json": "Result.json",
+    "m3u": "Result.m3u",
+}
+
+
+class Cancelled(Exception):
+    """由进度回调抛出，在两个项目之间停止匹配或复制。"""
+
+
+@dataclass
+class LineupConfig:
+    """一次排序运行的全部设置，对应图形界面“快速设置”和“配置”选项卡中的选项。"""
+    similarity_threshold: float = 0.6
+    auto_select_highest: bool = False
+    generate_list_only: bool = False
+    ignore_directories: bool = False
+    output_format: str = "text"
+    filename_format: str = "relative"
+    output_folder: str = ""
+    rename_mode: str = "add_prefix"
+    separator: str = "-"
+    format_str: str = "[Num]"
+    start_num: int = 1
+    step: int = 1
+    reverse: bool = False
+    end_num: int = 1
+    scorer: str = "difflib"  # "difflib" 或 "numpy"
+    workers: int = 1  # difflib 打分使用的进程数，0 表示全部 CPU 核心
+    assignment: str = "sequential"  # "sequential" 按列表顺序，"global" 全局分配
+    copy_workers: int = 4  # 复制结果时同时复制的文件数
+    link_mode: str = "copy"  # 生成结果的方式："copy"、"hardlink"、"symlink" 或 "reflink"
+    cache_index: bool = True  # 把文件夹索引缓存在文件夹旁边，文件夹未变化时不再重新列出
+    in_place: bool = False  # 在源文件夹中直接重命名匹配的项目，不生成 Result 文件夹（可撤销）
+    recursive: bool = False  # 递归扫描子文件夹中的文件，项目名为相对路径
+    extra_folders: list = field(default_factory=list)  # 其他源文件夹，按优先级排列在源文件夹之后
+    scan_workers: int = SCAN_WORKERS  # 扫描多个源文件夹或子文件夹时同时列出的目录数
+    normalize: bool = True  # 规范化（全半角、大小写、括号、扩展名）后相同的名称视为完全匹配
+    to_simplified: bool = False  # 规范化时把繁体转为简体（需要安装 opencc）
+    match_tags: bool = False  # 音乐文件按标签中的“艺术家-标题”匹配（需要安装 mutagen）
+    top_k: int = 10  # numpy 打分或全局分配时每行保留的候选数
+
+
+def clean_list_item(item):
+    # 移除括号
+    return strip_brackets(item)
+
+
+def generate_new_name(config, num, item):
+    # 递归扫描时项目是相对路径，新名称只取文件名部分
+    item = os.path.basename(item)
+    if config.rename_mode == "add_prefix":
+        return f"{num}{config.separator}{item}"
+    else:
+        base = config.format_str.replace("[Num]", str(num))
+        # 过滤特殊字符
+        base = re.sub(r'[<>:"|?*\\/]', '', base)
+        # 保留扩展名
+        name, ext = os.path.splitext(item)
+        return base + ext
+
+
+def compute_numbers(config, count):
+    if config.reverse:
+        return [config.end_num - i * config.step for i in range(count)]
+    return [config.start_num + i * config.step for i in range(count)]
+
+
+def char_profile(s):
+    """预先计算的 (长度, 字符计数)，用于相似度上界剪枝。"""
+    return len(s), Counter(s)
+
+
+def _ratio_bound(matches, length):
+    # 与 difflib 内部的 _calculate_ratio 相同，保证上界与 ratio() 在浮点上可比
+    if length:
+        return 2.0 * matches / length
+    return 1.0
+
+
+def find_candidates(clean_item, items, threshold, profiles=None, stats=None, common=None, stop_at_perfect=True):
+    """返回 (完全匹配项, 按相似度降序排列的候选列表)。
+
+    完整的 ratio() 之前先用两层上界剪枝：长度上界（即 real_quick_ratio）和
+    字符计数上界（即 quick_ratio）。上界达不到阈值的项目不可能成为候选，
+    所以结果与逐个计算 ratio() 完全相同。
+    profiles 是项目名到 char_profile() 的映射；stats 是 Counter，记录各层排除的次数；
+    common 是 CandidateIndex.lookup() 已经算好的公共字符数，提供时不再重新计数。
+    stop_at_perfect 为 False 时遇到完全匹配不提前返回，而是把它 (相似度 1.0)
+    和其他候选一起放进列表，供并行打分后在主进程中按剩余项目重新挑选。
+    """
+    la, ca = char_profile(clean_item)
+    candidates = []
+    for it in items:
+        lb, cb = profiles[it] if profiles is not None else char_profile(it)
+        total = la + lb
+        if stats is not None:
+            stats["compared"] += 1
+
+        # 第一层：长度上界
+        bound = _ratio_bound(min(la, lb), total)
+        if bound < 1.0 and bound <= threshold:
+            if stats is not None:
+                stats["pruned_length"] += 1
+            continue
+
+        # 第二层：字符计数上界
+        if common is not None:
+            shared = common[it]
+        elif len(ca) <= len(cb):
+            shared = sum(min(n, cb[c]) for c, n in ca.items())
+        else:
+            shared = sum(min(n, ca[c]) for c, n in cb.items())
+        bound = _ratio_bound(shared, total)
+        if bound < 1.0 and bound <= threshold:
+            if stats is not None:
+                stats["pruned_quick"] += 1
+            continue
+
+        # 第三层：完整的 difflib 相似度
+        similarity = difflib.SequenceMatcher(None, clean_item, it).ratio()
+        if stats is not None:
+            stats["scored"] += 1
+        if similarity == 1.0 and stop_at_perfect:
+            return it, []  # 找到完全匹配，直接使用
+        elif similarity > threshold or similarity == 1.0:
+            candidates.append((it, similarity))
+        elif stats is not None:
+            stats["rejected_ratio"] += 1
+    # 按相似度排序
+    candidates.sort(key=lambda x: x[1], reverse=True)
+    return None, candidates
+
+
+class CandidateIndex:
+    """文件夹项目的字符倒排索引，每次运行建立一次。
+
+    索引的词是 (字符, 第几次出现)，一个项目与某行共有的词数恰好等于 quick_ratio
+    中的公共字符数。查询时合并该行各词的倒排表，就得到每个项目的公共字符数，
+    只保留字符计数上界能超过阈值的项目。中文字符很少见，倒排表短，
+    通常只剩几十个候选。结果与遍历全部项目完全一致。
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.lengths = [len(it) for it in self.items]
+        self.postings = defaultdict(list)
+        for pos, it in enumerate(self.items):
+            for c, n in Counter(it).items():
+                for k in range(1, n + 1):
+                    self.postings[(c, k)].append(pos)
+
+    def lookup(self, clean_item, threshold, removed=()):
+        """返回 {项目: 公共字符数}，只包含可能超过阈值（或完全匹配）的项目，保持原有顺序。"""
+        la = len(clean_item)
+        if la == 0:
+            return {it: 0 for pos, it in enumerate(self.items) if pos not in removed}
+        # 至少需要的公共字符数：由 2c/(la+lb) > threshold 且 c <= lb 推出
+        th = min(max(threshold, 0.0), 1.0)
+        need = max(1, math.ceil(th * la / (2 - th) - 1e-9))
+        need = min(need, la)  # 完全匹配需要 la 个公共字符
+
+        counts = Counter()
+        for c, n in Counter(clean_item).items():
+            for k in range(1, n + 1):
+                postings = self.postings.get((c, k))
+                if postings:
+                    counts.update(postings)
+        lengths = self.lengths
+        positions = sorted(
+            pos for pos, common in counts.items()
+            if common >= need and pos not in removed
+            and (_ratio_bound(common, la + lengths[pos]) > threshold or common == la == lengths[pos])
+        )
+        return {self.items[pos]: counts[pos] for pos in positions}
+
+
+class ScoringTables:
+    """文件夹项目表的打分数据（位置、字符画像、倒排索引），按需建立。
+
+    同一个项目表匹配多个列表时（例如批量模式）只需建立一次。
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.positions = {it: pos for pos, it in enumerate(self.items)}
+        self._exact = {}
+
+    @cached_property
+    def profiles(self):
+        return {it: char_profile(it) for it in self.items}
+
+    @cached_property
+    def index(self):
+        return CandidateIndex(self.items)
+
+    def exact(self, normalize=True, to_simplified=False):
+        """完全匹配索引，每种规范化设置只建立一次。"""
+        key = (normalize, to_simplified)
+        if key not in self._exact:
+            self._exact[key] = ExactIndex(self.items, normalize, to_simplified)
+        return self._exact[key]
+
+    @cached_property
+    def vector(self):
+        """NumPy 批量打分器，top_k() 返回每行得分最高的项目下标。需要安装 numpy。"""
+        try:
+            from lineup_vector import VectorScorer
+        except ImportError:
+            raise RuntimeError("NumPy 打分需要安装 numpy：pip install numpy")
+        return VectorScorer(self.items)
+
+
+def basename_keys(items):
+    """递归扫描时参与匹配的名称：项目的文件名（不含子文件夹），与 items 一一对应。
+
+    多个子文件夹中有同名项目时，第一个用文件名，其余仍用相对路径。
+    """
+    keys = []
+    used = set()
+    for item in items:
+        key = os.path.basename(item)
+        if key in used:
+            key = item
+        used.add(key)
+        keys.append(key)
+    return keys
+
+
+def match_keys(index, items, config):
+    """参与匹配的名称，与 items 一一对应且互不相同；匹配结果再用它们换回项目名。
+
+    递归扫描时用文件名（见 basename_keys），开启 match_tags 时用标签目录中的
+    “艺术家-标题”（见 lineup_catalog.tag_keys），否则就是 items 本身。
+    """
+    keys = basename_keys(items) if config.recursive else items
+    if config.match_tags:
+        keys = tag_keys(index, items, config.scan_workers, names=keys)
+    return keys
+
+
+def exact_lookup(tables, lines, clean_lines, config):
+    """返回 (每行的完全匹配项目位置, 每行有歧义的项目位置)，见 ExactIndex.lookup。"""
+    exact = tables.exact(config.normalize, config.to_simplified)
+    results = [exact.lookup(item, clean_item) for item, clean_item in zip(lines, clean_lines)]
+    return [hits for hits, ambiguous in results], [ambiguous for hits, ambiguous in results]
+
+
+def with_ambiguous(candidates, positions, clean_item, items):
+    """把规范化后有歧义的项目加入候选列表，低于阈值的也加入，按 difflib 相似度重新排序。"""
+    present = {it for it, sim in candidates}
+    extra = [(items[pos], difflib.SequenceMatcher(None, clean_item, items[pos]).ratio())
+             for pos in positions if items[pos] not in present]
+    if not extra:
+        return candidates
+    return sorted(candidates + extra, key=lambda x: x[1], reverse=True)
+
+
+def pick_remaining(candidates, removed, positions):
+    """从完整的候选列表中去掉已被使用的项目，返回与串行 find_candidates 相同的结果。"""
+    remaining = [(it, sim) for it, sim in candidates if positions[it] not in removed]
+    for it, sim in remaining:
+        if sim == 1.0:
+            return it, []
+    return None, remaining
+
+
+_worker_state = {}
+
+
+def _init_score_worker(items, threshold):
+    # 每个工作进程只接收并建立一次文件夹项目表和索引
+    _worker_state["threshold"] = threshold
+    _worker_state["profiles"] = {it: char_profile(it) for it in items}
+    _worker_state["index"] = CandidateIndex(items)
+
+
+def _score_chunk(clean_lines):
+    threshold = _worker_state["threshold"]
+    index = _worker_state["index"]
+    stats = Counter()
+    results = []
+    for clean_item in clean_lines:
+        pool = index.lookup(clean_item, threshold)
+        stats["indexed_out"] += len(index.items) - len(pool)
+        perfect_match, candidates = find_candidates(
+            clean_item, pool, threshold, _worker_state["profiles"], stats, common=pool, stop_at_perfect=False)
+        results.append(candidates)
+    return results, stats
+
+
+def parallel_candidates(items, clean_lines, threshold, workers, stats=None, line_progress=None):
+    """用多个进程为每一行计算完整的候选列表（不考虑其他行已使用的项目）。"""
+    chunk_size = max(1, math.ceil(len(clean_lines) / (workers * 4)))
+    chunks = [clean_lines[start:start + chunk_size] for start in range(0, len(clean_lines), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_score_worker,
+                             initargs=(items, threshold)) as executor:
+        try:
+            for chunk_results, chunk_stats in executor.map(_score_chunk, chunks):
+                results.extend(chunk_results)
+                if stats is not None:
+                    stats.update(chunk_stats)
+                if line_progress is not None:
+                    line_progress(len(results), len(clean_lines))
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+    return results
+
+
+def count_candidates(stats, candidates):
+    """记录一行模糊打分得到的候选数。"""
+    if stats is not None:
+        stats["candidate_lines"] += 1
+        stats["candidates"] += len(candidates)
+        stats["max_candidates"] = max(stats["max_candidates"], len(candidates))
+
+
+def resolve_workers(workers):
+    """0 或负数表示使用全部 CPU 核心。"""
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def format_match_stats(stats):
+    return (f"完全匹配（查表）{stats['exact']} 行；索引排除 {stats['indexed_out']}，比较 {stats['compared']} 次：长度上界排除 {stats['pruned_length']}，"
+            f"字符计数上界排除 {stats['pruned_quick']}，"
+            f"完整相似度计算 {stats['scored']} 次（其中低于阈值 {stats['rejected_ratio']}）")
+
+
+def match_items(lines, items, config, select_candidate=None, stats=None, scores=None, line_progress=None,
+                review=None, tables=None):
+    """将列表中的每一行匹配到文件夹项目。
+
+    select_candidate(item, candidates) 在有多个候选且未开启自动选择时调用，
+    返回选中的项目名，返回 None 表示跳过。未提供时跳过该行。
+    review(requests) 是批量版本：先为所有行打分，再一次性交给调用方审阅所有有多个
+    候选的行。requests 是 [(行号, 行内容, 候选)]，返回 {行号: 选中的项目}，没有
+    出现的行视为跳过。提供 review 时不再调用 select_candidate。
+    传入字典作为 scores 时，记录每个匹配行 (行号) 所选项目的相似度。
+    line_progress(已打分行数, 总行数) 报告打分进度，可以抛出 Cancelled 中止匹配。
+    tables 是已经为 items 建立的 ScoringTables，提供时直接使用，items 被忽略。
+    返回 (matched, missed, unused)。
+    """
+    lines = list(lines)
+    clean_lines = [clean_list_item(item) for item in lines]
+    if tables is None:
+        tables = ScoringTables(items)
+    all_items = tables.items
+    if scores is None:
+        scores = {}
+    if config.assignment == "global":
+        return _match_global(lines, clean_lines, tables, config, select_candidate, stats, scores, line_progress,
+                             review)
+    if review is not None and not config.auto_select_highest:
+        return _match_reviewed(lines, clean_lines, tables, config, stats, scores, line_progress, review)
+
+    positions = tables.positions
+    removed = set()
+    matched = []
+    missed = []
+    # 完全匹配（原名、规范化名或主干相同）直接查字典，不需要模糊打分
+    exact_hits, ambiguous = exact_lookup(tables, lines, clean_lines, config)
+
+    ranked = scored = None
+    workers = resolve_workers(config.workers)
+    if config.scorer == "numpy":
+        # 向量打分先给每行排出前几名，后面只对这些项目计算精确相似度
+        ranked = tables.vector.top_k(clean_lines, config.top_k * 2)
+    elif workers > 1 and len(clean_lines) > 1:
+        # 多进程先为没有完全匹配的行打分，下面按列表顺序依次分配，结果与串行相同；
+        # 有完全匹配的行只在它们的完全匹配都已被占用时才单独打分
+        todo = [i for i, hits in enumerate(exact_hits) if not hits]
+        scored = dict(zip(todo, parallel_candidates(
+            all_items, [clean_lines[i] for i in todo], config.similarity_threshold, workers, stats, line_progress)))
+
+    for i, item in enumerate(lines, 1):
+        clean_item = clean_lines[i-1]
+        exact = next((pos for pos in exact_hits[i-1] if pos not in removed), None)
+        if exact is not None:
+            perfect_match, candidates = all_items[exact], []
+            if stats is not None:
+                stats["exact"] += 1
+        elif scored is not None and i - 1 in scored:
+            perfect_match, candidates = pick_remaining(scored[i-1], removed, positions)
+        else:
+            if ranked is not None:
+                top = [pos for pos in ranked[i-1] if pos not in removed][:config.top_k]
+                pool = [all_items[pos] for pos in sorted(top)]
+                common = None
+            else:
+                pool = common = tables.index.lookup(clean_item, config.similarity_threshold, removed)
+            if stats is not None:
+                stats["indexed_out"] += len(all_items) - len(removed) - len(pool)
+            perfect_match, candidates = find_candidates(
+                clean_item, pool, config.similarity_threshold, tables.profiles, stats, common=common)
+        if exact is None:
+            if perfect_match is None:
+                candidates = with_ambiguous(candidates, [pos for pos in ambiguous[i-1] if pos not in removed],
+                                            clean_item, all_items)
+            count_candidates(stats, candidates)
+        if line_progress is not None and scored is None:
+            line_progress(i, len(lines))
+
+        if perfect_match:
+            matched_item = perfect_match
+        elif candidates:
+            if len(candidates) == 1 or config.auto_select_highest:
+                matched_item = candidates[0][0]
+            else:
+                # 多个候选，交给调用方选择
+                choice = select_candidate(item, candidates) if select_candidate else None
+                if choice is None:
+                    missed.append((i, item))
+                    continue
+                matched_item = choice
+        else:
+            missed.append((i, item))
+            continue
+
+        matched.append((i, matched_item))
+        removed.add(positions[matched_item])
+        scores[i] = 1.0 if perfect_match else dict(candidates).get(matched_item, 0.0)
+
+    unused = [it for pos, it in enumerate(all_items) if pos not in removed]
+    return matched, missed, unused
+
+
+def score_all_lines(tables, clean_lines, config, stats=None, line_progress=None):
+    """不考虑分配，为每一行计算完整的候选列表（含完全匹配），按相似度降序排列。"""
+    all_items = tables.items
+    threshold = config.similarity_threshold
+    workers = resolve_workers(config.workers)
+    if config.scorer != "numpy" and workers > 1 and len(clean_lines) > 1:
+        return parallel_candidates(all_items, clean_lines, threshold, workers, stats, line_progress)
+
+    profiles = tables.profiles
+    if config.scorer == "numpy":
+        ranked = tables.vector.top_k(clean_lines, config.top_k)
+        index = None
+    else:
+        ranked = None
+        index = tables.index
+    results = []
+    for i, clean_item in enumerate(clean_lines):
+        if ranked is not None:
+            pool = [all_items[pos] for pos in sorted(ranked[i])]
+            common = None
+        else:
+            pool = common = index.lookup(clean_item, threshold)
+        if stats is not None:
+            stats["indexed_out"] += len(all_items) - len(pool)
+        perfect_match, candidates = find_candidates(
+            clean_item, pool, threshold, profiles, stats, common=common, stop_at_perfect=False)
+        results.append(candidates)
+        if line_progress is not None:
+            line_progress(i + 1, len(clean_lines))
+    return results
+
+
+def _match_reviewed(lines, clean_lines, tables, config, stats, scores, line_progress, review):
+    """按列表顺序分配并批量审阅，结果与逐行询问的顺序匹配相同。
+
+    先为没有完全匹配的行计算完整的候选列表；有完全匹配的行以完全匹配的项目
+    （相似度 1.0）作为候选，只有它们都被前面的行占用时才对这一行模糊打分。
+    分配和审阅见 _assign_in_order。
+    """
+    all_items = tables.items
+    exact_hits, ambiguous = exact_lookup(tables, lines, clean_lines, config)
+    todo = [i for i, hits in enumerate(exact_hits) if not hits]
+    scored = [[(all_items[pos], 1.0) for pos in hits] for hits in exact_hits]
+    for i, candidates in zip(todo, score_all_lines(tables, [clean_lines[i] for i in todo], config, stats,
+                                                   line_progress)):
+        scored[i] = with_ambiguous(candidates, ambiguous[i], clean_lines[i], all_items)
+        count_candidates(stats, scored[i])
+
+    def rescore(i):
+        candidates = score_all_lines(tables, [clean_lines[i]], replace(config, workers=1), stats)[0]
+        candidates = with_ambiguous(candidates, ambiguous[i], clean_lines[i], all_items)
+        count_candidates(stats, candidates)
+        return candidates
+
+    choices = {}
+    taken = set()
+    _assign_in_order(lines, scored, choices, taken, scores, None, review,
+                     rescore=rescore, pending={i for i, hits in enumerate(exact_hits) if hits})
+    if stats is not None:
+        stats["exact"] += sum(1 for i, hits in enumerate(exact_hits)
+                              if i in choices and choices[i] in {all_items[pos] for pos in hits})
+
+    matched = [(i + 1, choices[i]) for i in range(len(lines)) if i in choices]
+    missed = [(i + 1, item) for i, item in enumerate(lines) if i not in choices]
+    unused = [it for it in all_items if it not in taken]
+    return matched, missed, unused
+
+
+def _match_global(lines, clean_lines, tables, config, select_candidate, stats, scores, line_progress=None,
+                  review=None):
+    """全局分配：先给所有行打分，再统一解决多行争用同一项目的冲突。
+
+    1. 完全匹配优先占用项目，前面某行的模糊匹配不会再抢走后面某行完全匹配的文件；
+    2. 开启自动选择时，把所有 (行, 项目, 相似度) 按相似度从高到低贪心分配；
+       否则按列表顺序处理，只剩一个可用候选的行直接分配，仍有多个的才询问
+       （见 _assign_in_order）。
+    """
+    choices, scored = score_global(lines, clean_lines, tables, config, stats, scores, line_progress)
+    return assign_global(lines, tables, config, choices, scored, scores, select_candidate, review)
+
+
+def score_global(lines, clean_lines, tables, config, stats=None, scores=None, line_progress=None):
+    """全局分配的打分阶段，返回 (choices, scored)。
+
+    choices 是已按完全匹配分配的 {行下标: 项目}，scored 是其余每行的候选列表
+    （已分配的行为空列表）。scores 记录完全匹配的相似度。
+    """
+    all_items = tables.items
+    if scores is None:
+        scores = {}
+    taken = set()
+    choices = {}
+
+    # 完全匹配按列表顺序直接查字典分配，只有剩下的行需要打分
+    exact_hits, ambiguous = exact_lookup(tables, lines, clean_lines, config)
+    for i, hits in enumerate(exact_hits):
+        for pos in hits:
+            if all_items[pos] not in taken:
+                choices[i] = all_items[pos]
+                taken.add(all_items[pos])
+                scores[i + 1] = 1.0
+                if stats is not None:
+                    stats["exact"] += 1
+                break
+    todo = [i for i in range(len(lines)) if i not in choices]
+    scored = [[] for _ in lines]
+    for i, candidates in zip(todo, score_all_lines(tables, [clean_lines[i] for i in todo], config, stats,
+                                                   line_progress)):
+        count_candidates(stats, candidates)
+        # 有歧义的项目总是保留在候选中
+        scored[i] = with_ambiguous(candidates[:config.top_k], ambiguous[i], clean_lines[i], all_items)
+    return choices, scored
+
+
+def assign_global(lines, tables, config, choices, scored, scores, select_candidate=None, review=None):
+    """全局分配的分配阶段：在 score_global 的结果上为其余的行分配项目，返回 (匹配, 未匹配, 未使用)。"""
+    all_items = tables.items
+    positions = tables.positions
+    taken = set(choices.values())
+
+    if config.auto_select_highest:
+        triples = sorted(
+            (-sim, i, positions[it], it)
+            for i, candidates in enumerate(scored) if i not in choices
+            for it, sim in candidates
+        )
+        for neg_sim, i, _, it in triples:
+            if i not in choices and it not in taken:
+                choices[i] = it
+                taken.add(it)
+                scores[i + 1] = -neg_sim
+    else:
+        _assign_in_order(lines, scored, choices, taken, scores, select_candidate, review)
+
+    matched = [(i + 1, choices[i]) for i in range(len(lines)) if i in choices]
+    missed = [(i + 1, item) for i, item in enumerate(lines) if i not in choices]
+    unused = [it for it in all_items if it not in taken]
+    return matched, missed, unused
+
+
+def _assign_in_order(lines, scored, choices, taken, scores, select_candidate, review, rescore=None, pending=()):
+    """按列表顺序分配还没有完全匹配的行。
+
+    可用候选中有相似度为 1.0 的项目时直接分配第一个，只剩一个可用候选时也直接分配。
+    提供 review 时，先把所有仍有多个可用候选的行一次交给 review，再按回答分配。
+    如果某行选中的项目已被前面的行占用（或原本只有一个候选的行因此变成多个），
+    从这一行开始再审阅一轮，因此前面的行始终优先，与逐行询问的结果一致。
+    pending 中的行只有完全匹配的候选，它们都被占用时用 rescore(行下标) 补上模糊打分的候选。
+    """
+    answers = {}  # 行下标 -> 审阅选中的项目，None 表示跳过
+    pending = set(pending)
+
+    def free_candidates(i):
+        free = [(it, sim) for it, sim in scored[i] if it not in taken]
+        if not free and i in pending:
+            pending.discard(i)
+            scored[i] = scored[i] + rescore(i)
+            free = [(it, sim) for it, sim in scored[i] if it not in taken]
+        return free
+
+    def perfect(free):
+        return next((it for it, sim in free if sim == 1.0), None)
+
+    def answered(i, free):
+        return i in answers and (answers[i] is None or answers[i] in dict(free))
+
+    start = 0
+    while start < len(scored):
+        if review is not None:
+            requests = []
+            for i in range(start, len(scored)):
+                if i in choices:
+                    continue
+                free = free_candidates(i)
+                if len(free) > 1 and perfect(free) is None and not answered(i, free):
+                    requests.append((i + 1, lines[i], free))
+            if requests:
+                picked = review(requests)
+                for line_no, item, free in requests:
+                    choice = picked.get(line_no)
+                    answers[line_no - 1] = choice if choice in dict(free) else None
+
+        stop = len(scored)
+        for i in range(start, len(scored)):
+            if i in choices:
+                continue
+            free = free_candidates(i)
+            if perfect(free) is not None:
+                choice = perfect(free)
+            elif len(free) == 1:
+                # 审阅时跳过的行如果只剩一个候选，与逐行询问一样直接分配
+                choice = free[0][0]
+            elif answered(i, free):
+                choice = answers[i]
+            elif free and review is not None:
+                stop = i  # 回答已失效，从这里开始再审阅一轮
+                break
+            elif free:
+                choice = select_candidate(lines[i], free) if select_candidate else None
+            else:
+                choice = None
+            if choice is not None:
+                choices[i] = choice
+                taken.add(choice)
+                scores[i + 1] = dict(free).get(choice, 0.0)
+        start = stop
+
+
+def format_preview(index, matched, missed, unused, new_names):
+    parts = ["预览结果:\n\n", "匹配的项目:\n"]
+    for idx, ((orig_idx, item), new_name) in enumerate(zip(matched, new_names), 1):
+        parts.append(f"{idx}. {new_name} ({index.type_label(item)})\n")
+    parts.append("\n")
+    if missed:
+        parts.append(f"未匹配的项目 (总共 {len(missed)} 个):\n")
+        parts.extend(f"  - {item} (第 {orig_idx} 行)\n" for orig_idx, item in missed)
+        parts.append("\n")
+    if unused:
+        parts.append(f"文件夹中未使用的项目 (总共 {len(unused)} 个):\n")
+        parts.extend(f"  - {u} ({index.type_label(u)})\n" for u in unused)
+    return "".join(parts)
+
+
+def preview_rows(index, plan):
+    """图形界面预览表格的数据：返回 (匹配, 未匹配, 未使用) 三个行列表。"""
+    matched = [
+        (n, new_name, item, orig_idx, round(score, 2), index.type_label(item))
+        for n, ((orig_idx, item), new_name, score) in enumerate(zip(plan.matched, plan.new_names, plan.scores), 1)
+    ]
+    missed = [(orig_idx, item) for orig_idx, item in plan.missed]
+    unused = [(u, index.type_label(u)) for u in plan.unused]
+    return matched, missed, unused
+
+
+def resolve_result_paths(folder, config, confirm=None, ask_string=None):
+    """确定输出目录和结果列表文件路径。用户取消时返回 None。
+
+    confirm(message) 返回 True/False；ask_string(title, prompt) 返回字符串或 None。
+    未提供 confirm 时视为同意覆盖。
+    """
+    result_file = RESULT_FILES.get(config.output_format, "Result.txt")
+    output_folder = config.output_folder.strip()
+
+    if output_folder:
+        result_dir = output_folder
+    elif config.generate_list_only or config.in_place:
+        result_dir = folder
+    else:
+        result_dir = os.path.join(folder, 'Result')
+        # 检查是否存在Result文件夹
+        if os.path.exists(result_dir) and confirm is not None:
+            choice = confirm("选择的文件夹中已存在 'Result' 文件夹。\n\n选择 '是' 以覆盖该文件夹，选择 '否' 将其当作排序项目并指定新的输出文件夹名称。")
+            if not choice:
+                # 要求输入新的输出文件夹名称
+                new_name = ask_string("输入新的输出文件夹名称", "请输入新的输出文件夹名称:") if ask_string else None
+                if new_name and new_name.strip():
+                    result_dir = os.path.join(folder, new_name.strip())
+                else:
+                    return None
+    result_list_path = os.path.join(result_dir, result_file)
+
+    # 检查输出文件是否已存在
+    if os.path.exists(result_list_path) and confirm is not None:
+        if not confirm(f"输出文件 '{os.path.basename(result_list_path)}' 已存在。\n\n是否覆盖该文件？"):
+            return None
+    return result_dir, result_list_path
+
+
+def write_list_only(result_list_path, index, matched, missed, unused, config, metrics=None, list_dir=None):
+    """只生成结果列表。list_dir 是结果列表所在的目录（批量模式的输出目录），提供时
+    相对路径相对于它计算，列表不在源文件夹中也能找到文件。"""
+    folder = index.folder
+    get_filename = _filename_getter(config, list_dir)
+    with open(result_list_path, 'w', encoding='utf-8') as f:
+        if config.output_format == "text":
+            f.write(f"# 文件排序 for 文件夹 {os.path.basename(folder)}\n")
+            f.write(f"# 使用配置 相似度阈值 {config.similarity_threshold} (仅生成列表)\n")
+            for orig_idx, item in matched:
+                f.write(f"{_item_filename(index, item, get_filename, list_dir)}\n")
+            _write_text_footer(f, index, missed, unused, get_filename, list_dir)
+        elif config.output_format == "json":
+            data = {
+                "folder": os.path.basename(folder),
+                "threshold": config.similarity_threshold,
+                "mode": "list_only",
+                "matched": [_item_filename(index, item, get_filename, list_dir) for _, item in matched],
+                "missed": [{"line": orig_idx, "item": item} for orig_idx, item in missed],
+                "unused": _unused_entries(index, unused, get_filename, list_dir),
+            }
+            if metrics is not None:
+                data["metrics"] = metrics.to_dict()
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        elif config.output_format == "m3u":
+            f.write("#EXTM3U\n")
+            for orig_idx, item in matched:
+                f.write(f"#EXTINF:-1,{item}\n")
+                f.write(f"{_item_filename(index, item, get_filename, list_dir)}\n")
+
+
+def copy_matched(index, result_dir, matched, new_names, workers=4, progress=None, mode="copy"):
+    jobs = [
+        (index.path(item), os.path.join(result_dir, new_name), index.is_dir(item))
+        for (orig_idx, item), new_name in zip(matched, new_names)
+    ]
+    # 文件的大小来自索引，目录中的文件在展开时再计入
+    stats = CopyStats(total_bytes=sum(index.size(item) for orig_idx, item in matched))
+    return copy_items(jobs, workers, progress, stats, mode=mode)
+
+
+def write_result_list(result_list_path, index, result_dir, matched, missed, unused, new_names, config,
+                      metrics=None):
+    folder = index.folder
+    get_filename = _filename_getter(config)
+    with open(result_list_path, 'w', encoding='utf-8') as f:
+        if config.output_format == "text":
+            f.write(f"# 文件排序 for 文件夹 {os.path.basename(folder)}\n")
+            f.write(f"# 使用配置 相似度阈值 {config.similarity_threshold}\n")
+            for (orig_idx, item), new_name in zip(matched, new_names):
+                item_type = index.type_label(item)
+                f.write(f"{get_filename(new_name, result_dir)} ({item_type})\n")
+            _write_text_footer(f, index, missed, unused, get_filename)
+        elif config.output_format == "json":
+            data = {
+                "folder": os.path.basename(folder),
+                "threshold": config.similarity_threshold,
+                "mode": "full",
+                "matched": [get_filename(new_name, result_dir) for new_name in new_names],
+                "missed": [{"line": orig_idx, "item": item} for orig_idx, item in missed],
+                "unused": _unused_entries(index, unused, get_filename),
+            }
+            if metrics is not None:
+                # 写出结果本身的用时此时还不知道，只显示在结果面板中
+                data["metrics"] = metrics.to_dict()
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        elif config.output_format == "m3u":
+            f.write("#EXTM3U\n")
+            for (orig_idx, item), new_name in zip(matched, new_names):
+                f.write(f"#EXTINF:-1,{item}\n")
+                f.write(f"{get_filename(new_name, result_dir)}\n")
+
+
+def _filename_getter(config, list_dir=None):
+    def get_filename(item, base_dir):
+        if config.filename_format == "absolute":
+            return os.path.join(base_dir, item)
+        elif list_dir is not None:
+            # 相对于结果列表所在的目录；不在同一个盘上时只能写绝对路径
+            path = os.path.abspath(os.path.join(base_dir, item))
+            try:
+                return os.path.relpath(path, os.path.abspath(list_dir))
+            except ValueError:
+                return path
+        else:
+            return item
+    return get_filename
+
+
+def _item_filename(index, item, get_filename, list_dir=None):
+    """源文件夹中的项目在结果列表中的路径。
+
+    相对路径默认相对于第一个源文件夹，其他源文件夹中的项目没有可用的相对路径，总是写绝对路径；
+    提供 list_dir 时 get_filename 相对于 list_dir 计算（见 _filename_getter）。
+    """
+    root = index.root(item)
+    if list_dir is None and os.path.abspath(root) != os.path.abspath(index.folder):
+        return os.path.join(os.path.abspath(root), item)
+    return get_filename(item, root)
+
+
+def _write_text_footer(f, index, missed, unused, get_filename, list_dir=None):
+    if missed:
+        f.write(f"# 未匹配项目 (总共 {len(missed)} 个未匹配)\n")
+        for orig_idx, item in missed:
+            f.write(f"# {item}(第 {orig_idx} 行)\n")
+    if unused:
+        f.write(f"# 文件夹中未使用的项目 (总共 {len(unused)} 个项目)\n")
+        for u in unused:
+            item_type = index.type_label(u)
+            f.write(f"# {_item_filename(index, u, get_filename, list_dir)} ({item_type})\n")
+
+
+def _unused_entries(index, unused, get_filename, list_dir=None):
+    return [{"item": _item_filename(index, u, get_filename, list_dir), "type": index.type_label(u)} for u in unused]
+
+
+# 影响匹配结果和新名称的设置；其他设置（输出格式、输出位置等）改变时计划仍然可用
+PLAN_FIELDS = (
+    "similarity_threshold", "auto_select_highest", "ignore_directories", "scorer", "top_k", "assignment",
+    "rename_mode", "separator", "format_str", "start_num", "step", "reverse", "end_num",
+    "recursive", "extra_folders", "normalize", "to_simplified", "match_tags",
+)
+PLAN_VERSION = 1
+
+
+@dataclass
+class MatchPlan:
+    """一次匹配的完整结果：匹配、未匹配、未使用的项目，所选候选的相似度，序号和新名称。
+
+    预览时生成，运行时只要文件夹和设置没有变化就直接执行，不再重新匹配和询问；
+    也可以保存为 JSON，之后单独执行。
+    """
+    folder: str
+    lines: list
+    config: LineupConfig
+    index_mtime_ns: int
+    matched: list  # [(行号, 项目)]
+    scores: list  # 与 matched 一一对应的相似度
+    missed: list  # [(行号, 行内容)]
+    unused: list
+    numbers: list
+    new_names: list
+
+    def is_current(self, folder, lines, config, index):
+        return (os.path.abspath(folder) == os.path.abspath(self.folder)
+                and list(lines) == self.lines
+                and index.mtime_ns == self.index_mtime_ns
+                and all(getattr(config, name) == getattr(self.config, name) for name in PLAN_FIELDS))
+
+    def to_dict(self):
+        data = asdict(self)
+        data["version"] = PLAN_VERSION
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != PLAN_VERSION:
+            raise ValueError("不支持的匹配计划版本")
+        known = {f.name for f in fields(LineupConfig)}
+        config = LineupConfig(**{k: v for k, v in data["config"].items() if k in known})
+        return cls(
+            folder=data["folder"],
+            lines=data["lines"],
+            config=config,
+            index_mtime_ns=data["index_mtime_ns"],
+            matched=[tuple(m) for m in data["matched"]],
+            scores=data["scores"],
+            missed=[tuple(m) for m in data["missed"]],
+            unused=data["unused"],
+            numbers=data["numbers"],
+            new_names=data["new_names"],
+        )
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def _phase(metrics, name):
+    return metrics.phase(name) if metrics is not None else nullcontext()
+
+
+def build_plan(index, lines, config, select_candidate=None, stats=None, line_progress=None, review=None,
+               metrics=None):
+    lines = list(lines)
+    scores = {}
+    items = index.names(config.ignore_directories)
+    if metrics is not None:
+        # 等待用户选择候选的时间单独计入 review 阶段
+        select_candidate = metrics.timed(select_candidate, "review")
+        review = metrics.timed(review, "review")
+        if stats is None:
+            stats = metrics.stats
+    # 递归扫描时用文件名、按标签匹配时用“艺术家-标题”参与匹配，结果再换回项目名
+    with _phase(metrics if config.match_tags else None, "tags"):
+        keys = match_keys(index, items, config)
+    with _phase(metrics, "matching"):
+        matched, missed, unused = match_items(lines, keys, config, select_candidate, stats, scores, line_progress,
+                                              review)
+    if keys is not items:
+        item_of = dict(zip(keys, items))
+        matched = [(orig_idx, item_of[key]) for orig_idx, key in matched]
+        unused = [item_of[key] for key in unused]
+    if metrics is not None:
+        metrics.lines = len(lines)
+        metrics.items = len(items)
+        metrics.matched = len(matched)
+
+    # 计算序号和新名称
+    nums = compute_numbers(config, len(matched))
+    new_names = [generate_new_name(config, num, item) for num, (orig_idx, item) in zip(nums, matched)]
+    return MatchPlan(
+        folder=os.path.abspath(index.folder),
+        lines=lines,
+        config=replace(config),
+        index_mtime_ns=index.mtime_ns,
+        matched=matched,
+        scores=[scores.get(orig_idx, 0.0) for orig_idx, item in matched],
+        missed=missed,
+        unused=unused,
+        numbers=nums,
+        new_names=new_names,
+    )
+
+
+def load_index(folder, config):
+    """读取源文件夹的项目表；递归或有多个源文件夹时合并所有源文件夹。"""
+    if config.recursive or config.extra_folders:
+        return LibraryIndex.load([folder] + list(config.extra_folders), config.recursive, config.cache_index,
+                                 config.scan_workers)
+    return FolderIndex.load(folder, config.cache_index)
+
+
+def prepare_plan(folder, lines, config, select_candidate=None, stats=None, plan=None, line_progress=None,
+                 review=None, metrics=None):
+    """读取文件夹索引，plan 仍然有效时直接沿用，否则重新匹配。返回 (index, plan)。
+
+    lines 可以是生成器（例如 lineup_lists.iter_list_file 的结果），只会读取一次。
+    metrics 是 lineup_metrics.RunMetrics，提供时记录各阶段的用时和计数。
+    """
+    lines = list(lines)
+    with _phase(metrics, "listing"):
+        index = load_index(folder, config)
+    if plan is None or not plan.is_current(folder, lines, config, index):
+        plan = build_plan(index, lines, config, select_candidate, stats, line_progress, review, metrics)
+    elif metrics is not None:
+        metrics.plan_reused = True
+        metrics.matched = len(plan.matched)
+    return index, plan
+
+
+def apply_plan(plan, config, index, confirm=None, ask_string=None, progress=None, metrics=None):
+    """按计划写出结果（复制项目、生成结果列表），返回给用户看的结果文本。
+
+    config 只用于输出相关的设置；匹配结果和新名称都来自计划。
+    progress(stats) 在复制过程中报告进度，stats 是 lineup_copy.CopyStats；它抛出 Cancelled 时
+    停止复制，不再生成结果列表。
+    提供 metrics 时，复制和写出结果的用时计入其中，结果文本末尾附上它的摘要。
+    """
+    result = _apply_plan(plan, config, index, confirm, ask_string, progress, metrics)
+    if metrics is not None:
+        result += metrics.summary()
+    return result
+
+
+def _apply_plan(plan, config, index, confirm, ask_string, progress, metrics):
+    missing = [item for orig_idx, item in plan.matched if item not in index.entries]
+    if missing:
+        raise ValueError(f"计划中的 {len(missing)} 个项目已不在文件夹中，例如: {missing[0]}")
+
+    folder = index.folder
+    paths = resolve_result_paths(folder, config, confirm, ask_string)
+    if paths is None:
+        return "操作已取消。"
+    result_dir, result_list_path = paths
+
+    # 如果仅生成列表
+    if config.generate_list_only:
+        with _phase(metrics, "output"):
+            write_list_only(result_list_path, index, plan.matched, plan.missed, plan.unused, config, metrics)
+        return f"列表生成完成！{os.path.basename(result_list_path)} 保存在 {result_dir}\n"
+
+    # 原地重命名：结果列表中的路径指向源文件夹中的新名称
+    if config.in_place:
+        if config.extra_folders:
+            raise ValueError("原地重命名只支持一个源文件夹")
+        # 递归扫描时项目留在原来的子文件夹中
+        renamed = [os.path.join(os.path.dirname(item), new_name)
+                   for (orig_idx, item), new_name in zip(plan.matched, plan.new_names)]
+        with _phase(metrics, "rename"):
+            journal_path = rename_in_place(folder, [(item, new)
+                                                    for (orig_idx, item), new in zip(plan.matched, renamed)])
+        with _phase(metrics, "output"):
+            os.makedirs(result_dir, exist_ok=True)
+            write_result_list(result_list_path, index, folder, plan.matched, plan.missed, plan.unused,
+                              renamed, config, metrics)
+        return (f"原地重命名完成！共 {len(plan.matched)} 个项目，结果列表保存在 {result_dir}\n"
+                f"撤销记录: {journal_path}\n")
+
+    # 确保输出目录存在
+    os.makedirs(result_dir, exist_ok=True)
+
+    # 复制或创建项目
+    with _phase(metrics, "copy"):
+        copy_stats = copy_matched(index, result_dir, plan.matched, plan.new_names, config.copy_workers, progress,
+                                  config.link_mode)
+    if metrics is not None:
+        metrics.record_copy(copy_stats)
+
+    # 生成结果列表
+    with _phase(metrics, "output"):
+        write_result_list(result_list_path, index, result_dir, plan.matched, plan.missed, plan.unused,
+                          plan.new_names, config, metrics)
+
+    return f"处理完成！结果保存在 {result_dir}\n{copy_stats.summary()}\n"
+
+
+def process_lineup(folder, lines, config, preview=False, select_candidate=None, confirm=None, ask_string=None,
+                   stats=None, plan=None, progress=None, line_progress=None, review=None, metrics=None):
+    """运行一次完整的排序，返回给用户看的结果文本。
+
+    select_candidate / confirm / ask_string 是交互回调，图形界面传入对话框，
+    命令行传入终端提示；不传时按非交互方式处理（跳过多候选行、直接覆盖）。
+    传入 Counter 作为 stats 可以收集匹配时各层剪枝的计数。
+    plan 是之前（例如预览时）生成的 MatchPlan，文件夹和设置都没有变化时直接使用。
+    line_progress / progress 分别报告打分和复制进度。
+    review 是批量审阅多候选行的回调（见 match_items），提供时代替 select_candidate。
+    结果文本末尾附上各阶段的用时和计数（未提供 metrics 时新建一个 RunMetrics）；
+    设置了环境变量 LINEUP_PROFILE 时把 cProfile 结果保存到它指定的文件。
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    with profiled():
+        index, plan = prepare_plan(folder, lines, config, select_candidate, stats, plan, line_progress, review,
+                                   metrics)
+        if preview:
+            return format_preview(index, plan.matched, plan.missed, plan.unused, plan.new_names) + metrics.summary()
+        return apply_plan(plan, config, index, confirm, ask_string, progress, metrics)
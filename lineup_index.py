@@ -0,0 +1,284 @@
+"""源文件夹的项目索引。
+
+用 os.scandir 列出一次文件夹，记录每个项目的类型和大小，并缓存到文件夹旁边的
+隐藏文件中。文件夹的修改时间没有变化时直接使用缓存，不再访问文件夹内容；
+变化时重新列出文件夹，已知的项目沿用缓存的信息，只对新项目读取大小。
+在网络共享上，这能省去大部分往返。
+
+LibraryIndex 把多个源文件夹（可以递归包含子文件夹）合并成一张以相对路径为键的
+项目表，排在前面的源文件夹优先。各个目录用线程池并行列出，结果同样缓存起来，
+之后只需并行检查各目录的修改时间，没有变化就不再重新遍历。
+"""
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from lineup_rename import is_journal
+
+INDEX_VERSION = 2
+LIBRARY_VERSION = 2
+SCAN_WORKERS = 8
+
+FILE = "file"
+DIRECTORY = "dir"
+OTHER = "other"
+
+
+def index_cache_path(folder, suffix="index"):
+    """缓存文件放在文件夹旁边（父目录中），避免写入文件夹本身而改变它的修改时间。"""
+    folder = os.path.abspath(folder)
+    parent, name = os.path.split(folder.rstrip(os.sep))
+    if not name:
+        return None
+    return os.path.join(parent, f".{name}.lineup-{suffix}.json")
+
+
+def _entry_kind(entry):
+    try:
+        if entry.is_dir():
+            return DIRECTORY
+        if entry.is_file():
+            return FILE
+    except OSError:
+        pass
+    return OTHER
+
+
+def _entry_size(entry, kind):
+    if kind != FILE:
+        return 0
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return 0
+
+
+class FolderIndex:
+    def __init__(self, folder, entries, mtime_ns=None):
+        self.folder = folder
+        # 名称 -> (类型, 大小)，保持 scandir 的顺序，与 os.listdir 一致
+        self.entries = entries
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def scan(cls, folder, previous=None):
+        """列出文件夹。previous 是旧索引，其中已有的项目不再读取大小。"""
+        known = previous.entries if previous is not None else {}
+        mtime_ns = os.stat(folder).st_mtime_ns
+        entries = {}
+        with os.scandir(folder) as it:
+            for entry in it:
+                if is_journal(entry.name):
+                    continue  # 原地重命名的撤销记录
+                kind = _entry_kind(entry)
+                cached = known.get(entry.name)
+                if cached is not None and cached[0] == kind:
+                    entries[entry.name] = cached
+                else:
+                    entries[entry.name] = (kind, _entry_size(entry, kind))
+        return cls(folder, entries, mtime_ns)
+
+    @classmethod
+    def load(cls, folder, use_cache=True):
+        """读取缓存的索引，文件夹有变化时增量刷新并写回缓存。"""
+        if not use_cache:
+            return cls.scan(folder)
+        cache_path = index_cache_path(folder)
+        cached = cls._read_cache(folder, cache_path)
+        if cached is not None and cached.mtime_ns == os.stat(folder).st_mtime_ns:
+            return cached
+        index = cls.scan(folder, cached)
+        index._write_cache(cache_path)
+        return index
+
+    @classmethod
+    def _read_cache(cls, folder, cache_path):
+        if cache_path is None:
+            return None
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION or data.get("folder") != os.path.abspath(folder):
+            return None
+        entries = {name: (kind, size) for name, kind, size in data["entries"]}
+        return cls(folder, entries, data["mtime_ns"])
+
+    def _write_cache(self, cache_path):
+        if cache_path is None:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "folder": os.path.abspath(self.folder),
+            "mtime_ns": self.mtime_ns,
+            "entries": [[name, kind, size] for name, (kind, size) in self.entries.items()],
+        }
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+        except OSError:
+            pass  # 父目录不可写时只使用内存中的索引
+
+    def names(self, ignore_directories=False):
+        if ignore_directories:
+            return [name for name, (kind, size) in self.entries.items() if kind == FILE]
+        return list(self.entries)
+
+    def is_dir(self, name):
+        entry = self.entries.get(name)
+        return entry is not None and entry[0] == DIRECTORY
+
+    def size(self, name):
+        entry = self.entries.get(name)
+        return entry[1] if entry is not None else 0
+
+    def type_label(self, name):
+        return "目录" if self.is_dir(name) else "文件"
+
+    def root(self, name):
+        """项目所在的源文件夹。"""
+        return self.folder
+
+    def path(self, name):
+        return os.path.join(self.root(name), name)
+
+
+def _scan_one(root, rel, recursive):
+    """列出一个目录，返回 (目录修改时间, [(相对路径, 类型, 大小)], [要继续遍历的子目录])。"""
+    path = os.path.join(root, rel) if rel else root
+    mtime_ns = os.stat(path).st_mtime_ns
+    entries = []
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if is_journal(entry.name):
+                continue
+            name = os.path.join(rel, entry.name) if rel else entry.name
+            if recursive:
+                # 递归时目录只用来继续遍历；跳过隐藏项目和顶层的 Result 输出目录
+                if entry.name.startswith(".") or (not rel and entry.name == "Result"):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    subdirs.append(name)
+                    continue
+            kind = _entry_kind(entry)
+            entries.append((name, kind, _entry_size(entry, kind)))
+    return mtime_ns, entries, subdirs
+
+
+def walk_roots(roots, recursive, workers=SCAN_WORKERS):
+    """用线程池并行遍历所有源文件夹。
+
+    返回 (每个源文件夹的项目列表, {(源文件夹下标, 相对目录): 修改时间})。
+    """
+    found = [[] for _ in roots]
+    dirs = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = {pool.submit(_scan_one, root, "", recursive): (n, "") for n, root in enumerate(roots)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                n, rel = pending.pop(future)
+                mtime_ns, entries, subdirs = future.result()
+                dirs[(n, rel)] = mtime_ns
+                found[n].extend(entries)
+                for sub in subdirs:
+                    pending[pool.submit(_scan_one, roots[n], sub, recursive)] = (n, sub)
+    return found, dirs
+
+
+class LibraryIndex(FolderIndex):
+    """多个源文件夹合并后的项目表，键是相对于所在源文件夹的路径。
+
+    同一个相对路径出现在多个源文件夹中时，使用排在前面的源文件夹中的项目。
+    folder 是第一个源文件夹，结果默认输出到这里。
+    """
+
+    def __init__(self, roots, recursive, entries, roots_of, dirs):
+        super().__init__(roots[0], entries, max(dirs.values(), default=None))
+        self.roots = roots
+        self.recursive = recursive
+        self.roots_of = roots_of  # 相对路径 -> 源文件夹下标
+        # (源文件夹下标, 相对目录) -> 修改时间。目录内容变化会更新它的修改时间，
+        # 所以最大值可以代替单个文件夹的 mtime_ns 判断匹配计划是否过期
+        self.dirs = dirs
+
+    @classmethod
+    def scan(cls, roots, recursive, workers=SCAN_WORKERS):
+        roots = [os.path.abspath(root) for root in roots]
+        found, dirs = walk_roots(roots, recursive, workers)
+        entries = {}
+        roots_of = {}
+        for n, root_entries in enumerate(found):
+            # 并行遍历的完成顺序不固定，排序后结果才稳定
+            for name, kind, size in sorted(root_entries):
+                if name not in entries:
+                    entries[name] = (kind, size)
+                    roots_of[name] = n
+        return cls(roots, recursive, entries, roots_of, dirs)
+
+    @classmethod
+    def load(cls, roots, recursive, use_cache=True, workers=SCAN_WORKERS):
+        """读取缓存的项目表；并行检查各目录的修改时间，有变化时重新遍历并写回缓存。"""
+        if not use_cache:
+            return cls.scan(roots, recursive, workers)
+        cache_path = index_cache_path(roots[0], "library")
+        cached = cls._read_library_cache(roots, recursive, cache_path)
+        if cached is not None and cached._unchanged(workers):
+            return cached
+        index = cls.scan(roots, recursive, workers)
+        index._write_library_cache(cache_path)
+        return index
+
+    def _unchanged(self, workers):
+        def current(key):
+            n, rel = key
+            try:
+                return os.stat(os.path.join(self.roots[n], rel) if rel else self.roots[n]).st_mtime_ns
+            except OSError:
+                return None
+        keys = list(self.dirs)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return all(mtime == self.dirs[key] for key, mtime in zip(keys, pool.map(current, keys)))
+
+    @classmethod
+    def _read_library_cache(cls, roots, recursive, cache_path):
+        if cache_path is None:
+            return None
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        roots = [os.path.abspath(root) for root in roots]
+        if (data.get("version") != LIBRARY_VERSION or data.get("roots") != roots
+                or data.get("recursive") != recursive):
+            return None
+        entries = {name: (kind, size) for name, kind, size, n in data["entries"]}
+        roots_of = {name: n for name, kind, size, n in data["entries"]}
+        dirs = {(n, rel): mtime_ns for n, rel, mtime_ns in data["dirs"]}
+        return cls(roots, recursive, entries, roots_of, dirs)
+
+    def _write_library_cache(self, cache_path):
+        if cache_path is None:
+            return
+        data = {
+            "version": LIBRARY_VERSION,
+            "roots": self.roots,
+            "recursive": self.recursive,
+            "entries": [[name, kind, size, self.roots_of[name]] for name, (kind, size) in self.entries.items()],
+            "dirs": [[n, rel, mtime_ns] for (n, rel), mtime_ns in self.dirs.items()],
+        }
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+    def root(self, name):
+        return self.roots[self.roots_of[name]]
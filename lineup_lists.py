@@ -0,0 +1,58 @@
+"""读取目的列表文件。
+
+所有格式都逐行读取并以生成器返回，不会先把整个文件读进内存：
+- .xlsx 以只读模式打开（openpyxl read_only），只遍历第一列；
+- .csv / .tsv 读取第一列；
+- 其他文件按文本处理，每行一项；
+- "-" 表示标准输入。
+"""
+import os
+import sys
+import csv
+
+LIST_FILETYPES = [("列表文件", "*.txt *.csv *.tsv"), ("文本文件", "*.txt"), ("CSV/TSV", "*.csv *.tsv"), ("所有文件", "*.*")]
+
+
+def _iter_text(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def _iter_text_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from _iter_text(f)
+
+
+def _iter_excel(path):
+    import openpyxl  # 只有导入Excel时才需要
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for (value,) in wb.active.iter_rows(min_col=1, max_col=1, values_only=True):
+            if value is not None and str(value).strip():
+                yield str(value).strip()
+    finally:
+        wb.close()
+
+
+def _iter_delimited(path, delimiter):
+    # Excel 导出的 CSV 常带 BOM
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            if row and row[0].strip():
+                yield row[0].strip()
+
+
+def iter_list_file(path, excel=False):
+    """按文件类型逐项读取列表，返回生成器。excel 为 True 时不看扩展名，总是按 Excel 工作簿读取。"""
+    if path == "-":
+        return _iter_text(sys.stdin)
+    ext = os.path.splitext(path)[1].lower()
+    if excel or ext == ".xlsx":
+        return _iter_excel(path)
+    if ext == ".csv":
+        return _iter_delimited(path, ",")
+    if ext == ".tsv":
+        return _iter_delimited(path, "\t")
+    return _iter_text_file(path)
@@ -0,0 +1,184 @@
+"""一次排序运行的分阶段计时和计数。
+
+RunMetrics 记录列出文件夹、匹配、选择候选（等待用户的时间）、复制和写出结果
+各阶段的用时，以及比较次数、每行候选数、复制的数据量和峰值内存。结果面板中
+显示它的摘要，json 格式的结果列表中也会写入它。
+
+设置环境变量 LINEUP_PROFILE（或命令行 --profile）为文件路径时，用 cProfile 记录
+这次运行并保存为 pstats 文件，可以用 python -m pstats 查看。多进程打分时只记录主进程。
+"""
+import os
+import sys
+import time
+import cProfile
+from collections import Counter
+from contextlib import contextmanager
+
+from lineup_copy import format_size
+
+PROFILE_ENV = "LINEUP_PROFILE"
+
+PHASE_LABELS = {
+    "listing": "列出文件夹",
+    "tags": "读取标签",
+    "matching": "匹配",
+    "review": "选择候选",
+    "rename": "重命名",
+    "copy": "复制",
+    "output": "写出结果",
+}
+
+
+def peak_memory():
+    """当前进程的峰值内存（字节），无法获取时返回 None。"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return _windows_peak_memory()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _windows_peak_memory():
+    try:
+        import ctypes
+        from ctypes import wintypes
+        psapi = ctypes.windll.psapi
+        kernel32 = ctypes.windll.kernel32
+    except (ImportError, AttributeError, OSError):
+        return None
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+@contextmanager
+def profiled(path=None):
+    """在 with 块中运行 cProfile，结束时保存到 path（未指定时取环境变量 LINEUP_PROFILE）。
+
+    两者都没有设置时不做任何事。
+    """
+    path = path or os.environ.get(PROFILE_ENV)
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+class RunMetrics:
+    """一次运行的各阶段用时和计数。
+
+    stats 是传给匹配引擎的 Counter（见 format_match_stats）。阶段可以嵌套，
+    内层阶段（例如匹配过程中弹出的候选对话框）的用时不计入外层阶段。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = {}
+        self.stats = Counter()
+        self.lines = 0
+        self.items = 0
+        self.matched = 0
+        self.plan_reused = False
+        self.copied_files = 0
+        self.copied_bytes = 0
+        self._stack = []
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        self.seconds.setdefault(name, 0.0)  # 按开始的顺序显示
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._stack.pop()
+            self.seconds[name] += elapsed
+            if self._stack:
+                self.seconds[self._stack[-1]] -= elapsed
+
+    def timed(self, callback, name):
+        """包装回调，把它的用时计入 name 阶段。callback 为 None 时返回 None。"""
+        if callback is None:
+            return None
+
+        def wrapper(*args):
+            with self.phase(name):
+                return callback(*args)
+        return wrapper
+
+    def record_copy(self, copy_stats):
+        self.copied_files += copy_stats.files
+        self.copied_bytes += copy_stats.bytes
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def candidates_per_line(self):
+        lines = self.stats["candidate_lines"]
+        return self.stats["candidates"] / lines if lines else 0.0
+
+    def _per_copy_second(self, value):
+        seconds = self.seconds.get("copy", 0.0)
+        return value / seconds if seconds > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            "seconds": {name: round(seconds, 4) for name, seconds in self.seconds.items()},
+            "total_seconds": round(self.total_seconds, 4),
+            "plan_reused": self.plan_reused,
+            "lines": self.lines,
+            "items": self.items,
+            "matched": self.matched,
+            "comparisons": self.stats["compared"],
+            "exact_matches": self.stats["exact"],
+            "candidates_per_line": round(self.candidates_per_line, 2),
+            "max_candidates": self.stats["max_candidates"],
+            "copied_files": self.copied_files,
+            "copied_bytes": self.copied_bytes,
+            "files_per_sec": round(self._per_copy_second(self.copied_files), 1),
+            "bytes_per_sec": round(self._per_copy_second(self.copied_bytes)),
+            "peak_memory_bytes": peak_memory(),
+            "match_stats": dict(self.stats),
+        }
+
+    def summary(self):
+        phases = "，".join(f"{PHASE_LABELS.get(name, name)} {seconds:.2f} 秒" for name, seconds in self.seconds.items())
+        parts = [f"用时：{phases or '无'}（共 {self.total_seconds:.2f} 秒）\n"]
+        if self.plan_reused:
+            parts.append("沿用了已有的匹配计划，没有重新匹配\n")
+        else:
+            parts.append(f"{self.lines} 行 × {self.items} 个项目：比较 {self.stats['compared']} 次，"
+                         f"完全匹配（查表）{self.stats['exact']} 行，平均每行 {self.candidates_per_line:.1f} 个候选"
+                         f"（最多 {self.stats['max_candidates']} 个）\n")
+        peak = peak_memory()
+        if peak is not None:
+            parts.append(f"峰值内存 {format_size(peak)}\n")
+        return "".join(parts)
@@ -0,0 +1,89 @@
+"""名称的规范化和完全匹配查找。
+
+为每个文件夹项目和列表行只计算一次规范化的键：
+- NFKC（全角字母数字和全角括号（）变为半角）、大小写折叠，
+- 【】〔〕〖〗 统一为 []，连续空白合并为一个空格，
+- 可选的繁体转简体（需要安装 opencc），
+- 另外去掉扩展名得到“主干”键。
+ExactIndex 用字典按 原名 → 规范化键 → 主干键 的顺序查找完全匹配，每行 O(1)，
+找到时不再进行模糊打分。规范化键或主干键对应多个项目时（例如 “Song” 与
+Song.flac、Song.mp3）无法确定是哪一个，不当作完全匹配。
+"""
+import re
+import unicodedata
+
+# 列表行中的括号注释，例如 “歌名(Live)”；NFKC 之后全角括号也会被匹配
+BRACKETS = re.compile(r'\([^)]*\)')
+_WIDE_BRACKETS = str.maketrans({"【": "[", "】": "]", "〔": "[", "〕": "]", "〖": "[", "〗": "]"})
+_SPACES = re.compile(r'\s+')
+# 只把这种形式当作扩展名，避免 “Mr. Brown” 之类的名称被截断
+_EXTENSION = re.compile(r'\.[0-9a-z]{1,5}$')
+
+
+def strip_brackets(item):
+    return BRACKETS.sub('', item).strip()
+
+
+def _simplifier():
+    try:
+        import opencc
+    except ImportError:
+        raise RuntimeError("繁体转简体需要安装 opencc：pip install opencc-python-reimplemented")
+    return opencc.OpenCC("t2s").convert
+
+
+def make_normalizer(to_simplified=False):
+    """返回 normalize(s)，把名称转换为规范化的键。"""
+    convert = _simplifier() if to_simplified else None
+
+    def normalize(s):
+        s = unicodedata.normalize("NFKC", s).translate(_WIDE_BRACKETS).casefold()
+        s = _SPACES.sub(" ", s).strip()
+        return convert(s) if convert is not None else s
+    return normalize
+
+
+def stem_key(key):
+    """去掉扩展名的键；没有扩展名时返回原键。"""
+    match = _EXTENSION.search(key)
+    return key[:match.start()].rstrip() if match else key
+
+
+class ExactIndex:
+    """项目名的完全匹配索引。
+
+    lookup() 返回某行的完全匹配项目位置，依次是：原名相同、规范化后只有一个项目
+    相同、去掉扩展名后只有一个项目相同。找到的项目视为相似度 1.0。
+    """
+
+    def __init__(self, items, normalize=True, to_simplified=False):
+        self.names = {it: pos for pos, it in enumerate(items)}
+        self.normalizer = make_normalizer(to_simplified) if normalize else None
+        self.keys = {}
+        self.stems = {}
+        if self.normalizer is not None:
+            for pos, it in enumerate(items):
+                key = self.normalizer(it)
+                self.keys.setdefault(key, []).append(pos)
+                self.stems.setdefault(stem_key(key), []).append(pos)
+
+    def lookup(self, item, clean_item):
+        """item 是原始的列表行，clean_item 是去掉括号后的行。
+
+        返回 (按优先级排列的完全匹配位置, 有歧义的位置)。有歧义的位置是规范化键或
+        主干键相同的多个项目，它们按普通候选处理（用 difflib 相似度排序，由用户选择）。
+        """
+        positions = []
+        ambiguous = []
+        pos = self.names.get(clean_item)
+        if pos is not None:
+            positions.append(pos)
+        if self.normalizer is not None:
+            # 先规范化再去括号，全角括号中的注释也能去掉
+            key = self.normalizer(strip_brackets(unicodedata.normalize("NFKC", item)))
+            for hits in (self.keys.get(key, []), self.stems.get(stem_key(key), [])):
+                for pos in hits:
+                    if pos in positions or pos in ambiguous:
+                        continue
+                    (positions if len(hits) == 1 else ambiguous).append(pos)
+        return positions, ambiguous
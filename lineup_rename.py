@@ -0,0 +1,168 @@
+"""原地重命名：不复制文件，直接在源文件夹中给项目加上序号。
+
+重命名分两步：先把所有项目改成唯一的临时名称，再改成最终名称，因此新旧名称
+互相重叠时也不会冲突。开始之前会在文件夹中写入撤销记录（每次运行一个，
+文件名带有时间，不会覆盖之前的记录；项目索引会跳过它们），undo_renames()
+可以根据它恢复原来的名称，即使上次重命名中途失败也可以恢复。撤销同样分两步，
+临时名称也写在撤销记录中，撤销中途失败时再次撤销会从中断的地方继续。
+"""
+import os
+import re
+import json
+import time
+import uuid
+
+JOURNAL_PREFIX = ".lineup-undo"
+# 撤销记录和写入过程中的临时文件；也匹配旧版本使用的 .lineup-undo.json
+_JOURNAL_FILE = re.compile(r"\.lineup-undo(-[0-9a-f-]+)?\.json(\.tmp)?")
+JOURNAL_VERSION = 1
+
+# 撤销记录的状态：planned 第一步进行中，staged 第二步进行中，done 完成，
+# undoing 撤销的第一步进行中，undo_staged 撤销的第二步进行中，undone 已撤销
+PLANNED = "planned"
+STAGED = "staged"
+DONE = "done"
+UNDOING = "undoing"
+UNDO_STAGED = "undo_staged"
+UNDONE = "undone"
+
+
+def _write_journal(path, journal):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(journal, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def is_journal(name):
+    """name 是否是撤销记录文件，这些文件不作为待匹配的项目。"""
+    return _JOURNAL_FILE.fullmatch(name) is not None
+
+
+def new_journal_path(folder):
+    """本次运行的撤销记录路径，文件名中带有开始的时间。"""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(folder, f"{JOURNAL_PREFIX}-{stamp}-{uuid.uuid4().hex[:6]}.json")
+
+
+def latest_journal(folder):
+    """文件夹中最新的撤销记录，没有时返回 None。"""
+    try:
+        paths = [os.path.join(folder, name) for name in os.listdir(folder)
+                 if is_journal(name) and name.endswith(".json")]
+        return max(paths, key=os.path.getmtime, default=None)
+    except OSError:
+        return None
+
+
+def read_journal(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        journal = json.load(f)
+    if journal.get("version") != JOURNAL_VERSION:
+        raise ValueError("不支持的撤销记录版本")
+    return journal
+
+
+def check_renames(folder, renames):
+    """重命名之前检查冲突，有问题时抛出 ValueError，此时还没有改动任何文件。"""
+    olds = {old for old, new in renames}
+    news = [new for old, new in renames]
+    if len(set(news)) != len(news):
+        raise ValueError("新名称有重复，请检查重命名设置")
+    for old, new in renames:
+        if not os.path.lexists(os.path.join(folder, old)):
+            raise ValueError(f"找不到项目: {old}")
+        if new not in olds and os.path.lexists(os.path.join(folder, new)):
+            raise ValueError(f"文件夹中已存在 '{new}'，原地重命名会覆盖它")
+
+
+def _two_phase(folder, moves, journal, journal_path, staged_state):
+    """moves 是 [(当前名称, 临时名称, 目标名称)]。当前名称已经是临时名称时跳过第一步。"""
+    for current, temp, target in moves:
+        if current != temp:
+            os.rename(os.path.join(folder, current), os.path.join(folder, temp))
+    journal["state"] = staged_state
+    _write_journal(journal_path, journal)
+    for current, temp, target in moves:
+        os.rename(os.path.join(folder, temp), os.path.join(folder, target))
+
+
+def rename_in_place(folder, renames, journal_path=None):
+    """把 renames 中的 (旧名称, 新名称) 在 folder 中原地重命名，返回撤销记录的路径。"""
+    if journal_path is None:
+        journal_path = new_journal_path(folder)
+    renames = [(old, new) for old, new in renames if old != new]
+    check_renames(folder, renames)
+
+    token = uuid.uuid4().hex[:8]
+    journal = {
+        "version": JOURNAL_VERSION,
+        "folder": os.path.abspath(folder),
+        "state": PLANNED,
+        "entries": [
+            {"old": old, "temp": f".lineup-{token}-{n}", "new": new}
+            for n, (old, new) in enumerate(renames)
+        ],
+    }
+    _write_journal(journal_path, journal)
+    moves = [(e["old"], e["temp"], e["new"]) for e in journal["entries"]]
+    _two_phase(folder, moves, journal, journal_path, STAGED)
+    journal["state"] = DONE
+    _write_journal(journal_path, journal)
+    return journal_path
+
+
+def _locate(folder, entry, state, undo_from=None):
+    # 临时名称是唯一的，先查它；其余按中断时所处的步骤判断项目现在的名称
+    if state == UNDO_STAGED:
+        names = [entry["undo_temp"], entry["old"]]
+    elif state == UNDOING:
+        # 撤销的第一步中断：项目在撤销的临时名称或开始撤销之前的位置
+        names = [entry["undo_temp"]] + _names_in(entry, undo_from)
+    else:
+        names = _names_in(entry, state)
+    for name in names:
+        if os.path.lexists(os.path.join(folder, name)):
+            return name
+    return None
+
+
+def _names_in(entry, state):
+    return [entry["temp"], entry["old"] if state == PLANNED else entry["new"]]
+
+
+def undo_renames(journal_path):
+    """按撤销记录恢复原来的名称，返回恢复的项目数。"""
+    journal = read_journal(journal_path)
+    if journal["state"] == UNDONE:
+        return 0
+    folder = journal["folder"]
+    state = journal["state"]
+    undo_from = journal.get("undo_from")
+
+    moves = []
+    missing = []
+    for entry in journal["entries"]:
+        current = _locate(folder, entry, state, undo_from)
+        if current is None:
+            missing.append(entry["new"])
+        elif current != entry["old"]:
+            moves.append((entry, current))
+    if missing:
+        raise ValueError(f"有 {len(missing)} 个项目找不到，无法撤销，例如: {missing[0]}")
+
+    if state not in (UNDOING, UNDO_STAGED):
+        # 先记下撤销用的临时名称，撤销中途失败时可以找到这些项目
+        token = uuid.uuid4().hex[:8]
+        for n, entry in enumerate(journal["entries"]):
+            entry["undo_temp"] = f".lineup-undo-{token}-{n}"
+        journal["undo_from"] = state
+        journal["state"] = UNDOING
+        _write_journal(journal_path, journal)
+    _two_phase(folder, [(current, entry["undo_temp"], entry["old"]) for entry, current in moves],
+               journal, journal_path, UNDO_STAGED)
+    journal["state"] = UNDONE
+    _write_journal(journal_path, journal)
+    return len(moves)
@@ -0,0 +1,94 @@
+"""基于 NumPy 的批量相似度打分（可选，需要安装 numpy）。
+
+把列表行和文件夹项目都编码成稀疏的字符 n-gram 计数向量，用几次批量的 NumPy
+运算一次算出“行 × 项目”的相似度矩阵（Dice 系数），每行只保留得分最高的
+几个项目，之后再交给 difflib 计算精确的相似度。
+"""
+from collections import Counter
+
+import numpy as np
+
+NGRAM_SIZES = (1, 2)
+# 每批相似度矩阵的单元数上限，控制内存占用（int64 计数，约 32MB）
+BATCH_CELLS = 4_000_000
+
+
+def ngram_tokens(s):
+    """字符 n-gram 词表，重复出现的 n-gram 按出现次数编号，使向量点积等于多重集交集。"""
+    tokens = []
+    for n in NGRAM_SIZES:
+        seen = Counter()
+        for i in range(len(s) - n + 1):
+            gram = s[i:i + n]
+            seen[gram] += 1
+            tokens.append((gram, seen[gram]))
+    return tokens
+
+
+class VectorScorer:
+    def __init__(self, items):
+        self.items = list(items)
+        self.vocab = {}
+        token_ids = []
+        file_ids = []
+        for pos, it in enumerate(self.items):
+            for token in ngram_tokens(it):
+                token_ids.append(self.vocab.setdefault(token, len(self.vocab)))
+                file_ids.append(pos)
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        file_ids = np.asarray(file_ids, dtype=np.int64)
+
+        # 按词排序后就是按列压缩的稀疏矩阵：post_files[post_ptr[t]:post_ptr[t+1]] 是含有词 t 的项目
+        order = np.argsort(token_ids, kind="stable")
+        self.post_files = file_ids[order]
+        self.post_ptr = np.searchsorted(token_ids[order], np.arange(len(self.vocab) + 1))
+        self.sizes = np.bincount(file_ids, minlength=len(self.items))
+
+    def top_k(self, lines, k):
+        """对每一行返回得分最高的最多 k 个项目的下标（numpy 数组，按得分降序）。"""
+        n_files = len(self.items)
+        if n_files == 0:
+            return [np.empty(0, dtype=np.int64) for _ in lines]
+        batch = max(1, BATCH_CELLS // n_files)
+        ranked = []
+        for start in range(0, len(lines), batch):
+            ranked.extend(self._top_k_batch(lines[start:start + batch], k))
+        return ranked
+
+    def _top_k_batch(self, lines, k):
+        n_files = len(self.items)
+        rows = []
+        tids = []
+        line_sizes = np.empty(len(lines), dtype=np.int64)
+        for row, line in enumerate(lines):
+            tokens = ngram_tokens(line)
+            line_sizes[row] = len(tokens)
+            known = [self.vocab[t] for t in tokens if t in self.vocab]
+            rows.extend([row] * len(known))
+            tids.extend(known)
+        tids = np.asarray(tids, dtype=np.int64)
+        starts = self.post_ptr[tids]
+        lengths = self.post_ptr[tids + 1] - starts
+
+        # 把所有用到的倒排表拼接起来，并标记每个位置属于哪一行
+        total = int(lengths.sum())
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        files = self.post_files[offsets + np.arange(total)]
+        row_ids = np.repeat(np.asarray(rows, dtype=np.int64), lengths)
+
+        common = np.bincount(row_ids * n_files + files, minlength=len(lines) * n_files)
+        common = common.reshape(len(lines), n_files)
+        denom = line_sizes[:, None] + self.sizes[None, :]
+        scores = np.divide(2.0 * common, denom, out=np.zeros(common.shape), where=denom > 0)
+
+        kk = min(k, n_files)
+        if kk < n_files:
+            top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        else:
+            top = np.tile(np.arange(n_files), (len(lines), 1))
+        ranked = []
+        for row in range(len(lines)):
+            idx = top[row]
+            idx = idx[scores[row, idx] > 0]
+            ranked.append(idx[np.argsort(-scores[row, idx], kind="stable")])
+        return ranked